@@ -41,6 +41,7 @@ cd src && python setup.py install --root %{buildroot} --no-compile --install-pur
 %{_python_site_packages_path}/hostcli*
 #%{_python_site_packages_path}/hostcli.*
 %{_platform_bin_path}/hostcli
+%{_platform_bin_path}/hostcli-daemon
 
 %pre
 
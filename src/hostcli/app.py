@@ -0,0 +1,390 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" The hostcli application, the osc_lib shell with the REST client of the hostcli commands
+    osc_lib and the modules of the REST client are imported with this module, only when a
+    command is run.
+"""
+
+import fnmatch
+import json
+import logging
+import shlex
+import threading
+import time
+
+from osc_lib import shell
+from osc_lib import utils
+from osc_lib.i18n import _
+
+from hostcli import coalesce
+from hostcli import commandindex
+from hostcli import prefetch
+from hostcli import responsecache
+from hostcli import resthandler
+from hostcli import retry
+from hostcli import timing
+from hostcli import tokencache
+from hostcli import tokenmanager
+
+
+CLOUDS_PARALLEL = 8
+CLOUDS_TIMEOUT = 60
+
+
+class WarmUp(object):
+    """Stands for a command requiring auth while the interactive mode is warming up"""
+    auth_required = True
+
+
+class HOSTCLI(shell.OpenStackShell):
+    LOG = logging.getLogger(__name__)
+    def __init__(self, stdin=None, stdout=None, stderr=None, token_cache=None):
+        super(HOSTCLI, self).__init__(
+            description='HOSTCLI',
+            version='0.1',
+            command_manager=commandindex.CommandManager('hostcli.commands'),
+            stdin=stdin,
+            stdout=stdout,
+            stderr=stderr
+            )
+        self.command_manager.add_command('complete', commandindex.CompleteCommand)
+        self.token_cache = token_cache
+        self.prefetcher = None
+        self.warm_up_thread = None
+        self.command_name = None
+
+    def build_option_parser(self, description, version):
+        from osc_lib.api import auth
+        parser = super(HOSTCLI, self).build_option_parser(
+            description,
+            version)
+        parser = auth.build_auth_plugins_option_parser(parser)
+        #HACK: Add the api version so that we wont use version 2
+        #This part comes from openstack module so it cannot be imported
+        parser.add_argument('--os-identity-api-version',
+                            metavar='<identity-api-version>',
+                            default=utils.env('OS_IDENTITY_API_VERSION'),
+                            help=_('Identity API version, default=%s '
+                                   '(Env: OS_IDENTITY_API_VERSION)') % 3,
+                           )
+        parser.add_argument('--rest-pool-size',
+                            metavar='<pool-size>',
+                            type=int,
+                            default=utils.env('HOSTCLI_REST_POOL_SIZE', default=resthandler.POOL_SIZE),
+                            help=_('Maximum number of kept-alive connections per REST host '
+                                   '(Env: HOSTCLI_REST_POOL_SIZE)'))
+        parser.add_argument('--rest-retries',
+                            metavar='<retries>',
+                            type=int,
+                            default=utils.env('HOSTCLI_REST_RETRIES', default=resthandler.POOL_RETRIES),
+                            help=_('Number of retries on REST connection errors '
+                                   '(Env: HOSTCLI_REST_RETRIES)'))
+        parser.add_argument('--rest-max-in-flight',
+                            metavar='<count>',
+                            type=int,
+                            default=utils.env('HOSTCLI_REST_MAX_IN_FLIGHT', default=resthandler.MAX_IN_FLIGHT),
+                            help=_('Maximum number of concurrent REST requests of one command '
+                                   '(Env: HOSTCLI_REST_MAX_IN_FLIGHT)'))
+        parser.add_argument('--rest-wire-format',
+                            metavar='<format>',
+                            choices=resthandler.WIRE_FORMATS,
+                            default=utils.env('HOSTCLI_REST_WIRE_FORMAT', default=resthandler.MSGPACK),
+                            help=_('Preferred encoding of the REST responses, msgpack is used only if '
+                                   'the msgpack module is installed and the server supports it. One of '
+                                   '%s (Env: HOSTCLI_REST_WIRE_FORMAT)') % ', '.join(resthandler.WIRE_FORMATS))
+        parser.add_argument('--rest-no-keepalive',
+                            action='store_true',
+                            help=_('Close the REST connection after every request'))
+        parser.add_argument('--retry-attempts',
+                            metavar='<attempts>',
+                            type=int,
+                            default=utils.env('HOSTCLI_RETRY_ATTEMPTS', default=retry.ATTEMPTS),
+                            help=_('Maximum number of attempts of a failing keystone or REST request '
+                                   '(Env: HOSTCLI_RETRY_ATTEMPTS)'))
+        parser.add_argument('--retry-deadline',
+                            metavar='<seconds>',
+                            type=float,
+                            default=utils.env('HOSTCLI_RETRY_DEADLINE', default=retry.DEADLINE),
+                            help=_('Give up retrying a failing request after this many seconds '
+                                   '(Env: HOSTCLI_RETRY_DEADLINE)'))
+        parser.add_argument('--circuit-threshold',
+                            metavar='<failures>',
+                            type=int,
+                            default=utils.env('HOSTCLI_CIRCUIT_THRESHOLD', default=retry.FAILURE_THRESHOLD),
+                            help=_('Consecutive failures of an endpoint after which the requests to it '
+                                   'wait until it is probed again after --circuit-reset, or fail at once '
+                                   'if that is past --retry-deadline (Env: HOSTCLI_CIRCUIT_THRESHOLD)'))
+        parser.add_argument('--circuit-reset',
+                            metavar='<seconds>',
+                            type=float,
+                            default=utils.env('HOSTCLI_CIRCUIT_RESET', default=retry.RESET_TIMEOUT),
+                            help=_('Seconds before a failing endpoint is tried again '
+                                   '(Env: HOSTCLI_CIRCUIT_RESET)'))
+        parser.add_argument('--clouds',
+                            metavar='<pattern>[,<pattern>]',
+                            default=utils.env('HOSTCLI_CLOUDS') or None,
+                            help=_('Run a list command against every cloud of clouds.yaml matching one of '
+                                   'the shell-style patterns, e.g. site-*, and merge the results with a '
+                                   'Cloud column (Env: HOSTCLI_CLOUDS)'))
+        parser.add_argument('--clouds-parallel',
+                            metavar='<count>',
+                            type=int,
+                            default=utils.env('HOSTCLI_CLOUDS_PARALLEL', default=CLOUDS_PARALLEL),
+                            help=_('Maximum number of clouds queried at the same time '
+                                   '(Env: HOSTCLI_CLOUDS_PARALLEL)'))
+        parser.add_argument('--clouds-timeout',
+                            metavar='<seconds>',
+                            type=float,
+                            default=utils.env('HOSTCLI_CLOUDS_TIMEOUT', default=CLOUDS_TIMEOUT),
+                            help=_('Report a cloud as failed if it does not answer within this many seconds '
+                                   '(Env: HOSTCLI_CLOUDS_TIMEOUT)'))
+        parser.add_argument('--no-cache',
+                            action='store_true',
+                            default=bool(utils.env('HOSTCLI_NO_CACHE')),
+                            help=_('Do not serve read-only requests from the response cache '
+                                   '(Env: HOSTCLI_NO_CACHE)'))
+        parser.add_argument('--coalesce',
+                            action='store_true',
+                            default=bool(utils.env('HOSTCLI_COALESCE')),
+                            help=_('Share the response of a read-only request with the other hostcli '
+                                   'processes of the user sending the same request at the same time '
+                                   '(Env: HOSTCLI_COALESCE)'))
+        parser.add_argument('--no-prefetch',
+                            action='store_true',
+                            default=bool(utils.env('HOSTCLI_NO_PREFETCH')),
+                            help=_('Do not prefetch the frequently used read-only requests in the '
+                                   'interactive mode (Env: HOSTCLI_NO_PREFETCH)'))
+        parser.add_argument('--os-token-cache',
+                            action='store_true',
+                            default=bool(utils.env('HOSTCLI_TOKEN_CACHE')),
+                            help=_('Reuse the keystone token of earlier invocations until it is about '
+                                   'to expire (Env: HOSTCLI_TOKEN_CACHE)'))
+        # --timing comes from osc_lib, it prints the phases of the run to the standard error
+        parser.add_argument('--timing-file',
+                            metavar='<file>',
+                            default=utils.env('HOSTCLI_TIMING_FILE') or None,
+                            help=_('Append the time spent in the phases of the run to the file as a JSON line '
+                                   '(Env: HOSTCLI_TIMING_FILE)'))
+        parser.add_argument('--batch',
+                            metavar='<file>',
+                            help=_('Run the commands of the file, one per line, within one session. '
+                                   'Use - to read the commands from the standard input'))
+        parser.add_argument('--batch-continue',
+                            action='store_true',
+                            help=_('Continue the batch after a failed command instead of stopping'))
+        parser.add_argument('--batch-results',
+                            metavar='<file>',
+                            help=_('Append the result of every batch command to the file as a JSON line'))
+
+        return parser
+
+    def initialize_app(self, argv):
+        from osc_lib import clientmanager
+        from osc_lib.cli import client_config as cloud_config
+        self.LOG.debug('initialize_app')
+        super(HOSTCLI, self).initialize_app(argv)
+        try:
+            self.cloud_config = cloud_config.OSC_Config(
+                override_defaults={
+                    'interface': None,
+                    'auth_type': self._auth_type,
+                },
+                pw_func=shell.prompt_for_password,
+            )
+        except (IOError, OSError):
+            self.log.critical("Could not read clouds.yaml configuration file")
+            self.print_help_if_requested()
+            raise
+        if not self.options.debug:
+            self.options.debug = None
+
+        self.retry_policy = retry.RetryPolicy(attempts=self.options.retry_attempts,
+                                              deadline=self.options.retry_deadline,
+                                              failure_threshold=self.options.circuit_threshold,
+                                              reset_timeout=self.options.circuit_reset)
+        resthandler.configure(retry_policy=self.retry_policy,
+                              response_cache=None if self.options.no_cache else responsecache.ResponseCache(),
+                              coalescer=coalesce.Coalescer() if self.options.coalesce else None,
+                              pool_size=self.options.rest_pool_size,
+                              retries=self.options.rest_retries,
+                              max_in_flight=self.options.rest_max_in_flight,
+                              wire_format=self.options.rest_wire_format,
+                              keepalive=not self.options.rest_no_keepalive)
+        setattr(clientmanager.ClientManager,
+                resthandler.API_NAME,
+                clientmanager.ClientCache(getattr(resthandler, 'make_instance')))
+        self.client_manager = tokencache.ClientManager(
+            cli_options=self.cloud,
+            api_version=self.api_version,
+            pw_func=shell.prompt_for_password,
+            token_cache=tokencache.TokenCache() if self.options.os_token_cache else self.token_cache,
+        )
+        self.cloud_managers = []
+        if self.options.clouds:
+            # the options of every cloud are validated in prepare_to_run_command, like those of client_manager
+            self.cloud_managers = [(name, tokencache.ClientManager(
+                                       cli_options=self.cloud_config.get_one(cloud=name,
+                                                                             argparse=self.options,
+                                                                             validate=False),
+                                       api_version=self.api_version,
+                                       pw_func=shell.prompt_for_password,
+                                       token_cache=self.client_manager.token_cache))
+                                   for name in self.match_clouds(self.options.clouds)]
+
+    def match_clouds(self, patterns):
+        """Returns the names of the clouds of clouds.yaml matching one of the comma separated patterns"""
+        patterns = [p.strip() for p in patterns.split(',') if p.strip()]
+        names = [n for n in sorted(self.cloud_config.get_cloud_names())
+                 if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+        if not names:
+            raise Exception('No cloud in clouds.yaml matches %s' % ','.join(patterns))
+        return names
+
+    def _final_defaults(self):
+
+        super(HOSTCLI, self)._final_defaults()
+        # Set the default plugin to token_endpoint if url and token are given
+        if self.options.url and self.options.token:
+            # Use service token authentication
+            self._auth_type = 'token_endpoint'
+        else:
+            self._auth_type = 'password'
+
+
+    def prepare_to_run_command(self, cmd):
+        from keystoneauth1.exceptions.http import BadGateway
+        self.LOG.debug('prepare_to_run_command %s', cmd.__class__.__name__)
+        warm_up = self.warm_up_thread
+        if warm_up and warm_up is not threading.current_thread():
+            warm_up.join()
+            self.warm_up_thread = None
+        if not isinstance(cmd, WarmUp):
+            self.command_name = getattr(cmd, 'cmd_name', None) or cmd.__class__.__name__
+        if self.cloud_managers:
+            # the clouds authenticate when the command queries them, concurrently
+            validate = getattr(cmd, 'auth_required', False)
+            with timing.span('prepare'):
+                for name, manager in self.cloud_managers:
+                    manager._auth_required = validate
+                    manager.set_cli_options(self.cloud_config.get_one(cloud=name,
+                                                                      argparse=self.options,
+                                                                      validate=validate))
+            return
+        breaker = self.retry_policy.breaker('keystone %s' % self.cloud.config.get('auth', {}).get('auth_url'))
+        with timing.span('prepare'):
+            return self.retry_policy.call(lambda: super(HOSTCLI, self).prepare_to_run_command(cmd),
+                                          BadGateway,
+                                          breaker)
+
+    def run(self, argv):
+        start = time.time()
+        try:
+            result = super(HOSTCLI, self).run(argv)
+        finally:
+            # nothing uses the tokens after the run, their renewals would only load keystone
+            tokenmanager.cancel_all()
+        timing.record('total', start, time.time() - start)
+        options = getattr(self, 'options', None)
+        if getattr(options, 'timing', False):
+            self.stderr.write(timing.report())
+        if getattr(options, 'timing_file', None):
+            # only the name of the command is recorded, the arguments may hold secrets
+            timing.append_record(options.timing_file,
+                                 'batch' if getattr(options, 'batch', None) else self.command_name,
+                                 result)
+        return result
+
+    def interact(self):
+        if self.options.batch:
+            return self.run_batch(self.options.batch)
+        if not self.options.no_prefetch:
+            self.prefetcher = prefetch.Prefetcher()
+            resthandler.configure(prefetcher=self.prefetcher)
+        self.warm_up()
+        return super(HOSTCLI, self).interact()
+
+    def warm_up(self):
+        """ Authenticate and look up the REST endpoint in the background while the prompt is shown
+            The token is renewed in the background afterwards, and the most frequently used
+            read-only requests are prefetched.
+        """
+        auth = self.cloud.config.get('auth', {}) if getattr(self, 'cloud', None) else {}
+        if self.cloud_managers or (self._auth_type == 'password' and not auth.get('password')):
+            # the password would be prompted for
+            return
+
+        def run():
+            try:
+                self.prepare_to_run_command(WarmUp())
+                req = self.client_manager.resthandler
+                if self.prefetcher:
+                    self.prefetcher.start(req)
+            except Exception as exp:
+                self.LOG.debug('Warming up failed: %s', exp)
+
+        self.warm_up_thread = threading.Thread(target=run)
+        self.warm_up_thread.daemon = True
+        self.warm_up_thread.start()
+
+    def run_batch(self, path):
+        """Run the commands of a batch file through this app, so they share the auth and the connections"""
+        commands = self.stdin if path == '-' else open(path)
+        results = open(self.options.batch_results, 'a') if self.options.batch_results else None
+        status = 0
+        try:
+            for lineno, line in enumerate(commands, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                start = time.time()
+                try:
+                    code = self.run_subcommand(shlex.split(line)) or 0
+                except SystemExit as exp:
+                    code = exp.code if isinstance(exp.code, int) else 1
+                except ValueError as exp:
+                    self.stderr.write('Line %d: %s\n' % (lineno, exp))
+                    code = 2
+                self.LOG.debug('batch line %d returned %d', lineno, code)
+                if results:
+                    results.write(json.dumps({'line': lineno,
+                                              'command': line,
+                                              'exit_code': code,
+                                              'elapsed': round(time.time() - start, 3)}) + '\n')
+                    results.flush()
+                if code:
+                    status = code
+                    if not self.options.batch_continue:
+                        break
+        finally:
+            if results:
+                results.close()
+            if commands is not self.stdin:
+                commands.close()
+        return status
+
+    def clean_up(self, cmd, result, err):
+        self.LOG.debug('clean_up %s', cmd.__class__.__name__)
+        if err:
+            self.LOG.debug('got an error: %s', err)
+        cache = resthandler.get_response_cache()
+        if cache:
+            self.LOG.debug(cache.stats())
+        coalescer = resthandler.get_coalescer()
+        if coalescer:
+            self.LOG.debug('%d responses shared by other processes', coalescer.shared)
+        if self.prefetcher:
+            self.LOG.debug('%d prefetched responses used', self.prefetcher.hits)
+            self.prefetcher.command_done()
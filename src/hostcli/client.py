@@ -0,0 +1,120 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Thin hostcli entry point
+    If a hostcli daemon is listening on the socket of the user, the command line and
+    the environment, and the standard input of --batch -, are forwarded to it and the
+    output of the command is streamed back. Otherwise the command is run in this process.
+    Keep the imports of this module minimal, they are paid by every invocation.
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+EXIT = 'exit'
+
+
+def socket_path():
+    if 'HOSTCLI_DAEMON_SOCKET' in os.environ:
+        return os.environ['HOSTCLI_DAEMON_SOCKET']
+    rundir = os.environ.get('XDG_RUNTIME_DIR') or \
+        os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                     'hostcli')
+    return os.path.join(rundir, 'hostcli-daemon.sock')
+
+
+def send_frame(stream, content):
+    data = json.dumps(content).encode('utf-8')
+    stream.write(struct.pack('!I', len(data)) + data)
+    stream.flush()
+
+
+def recv_frame(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    length = struct.unpack('!I', header)[0]
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def connect(path):
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+
+def _write(stream, text):
+    if not isinstance(text, str):
+        # unicode on python 2
+        text = text.encode('utf-8')
+    stream.write(text)
+    stream.flush()
+
+
+def reads_stdin(argv):
+    """Only a batch read from the standard input needs it, the input of the caller is left alone otherwise"""
+    for i, arg in enumerate(argv):
+        if arg == '--batch=-' or (arg == '--batch' and argv[i + 1:i + 2] == ['-']):
+            return True
+    return False
+
+
+def forward(sock, argv):
+    stdin = sys.stdin.read() if sys.stdin is not None and reads_stdin(argv) else None
+    stream = sock.makefile('rwb')
+    try:
+        send_frame(stream, {'argv': argv,
+                            'env': dict(os.environ),
+                            'cwd': os.getcwd(),
+                            'stdin': stdin})
+        while True:
+            frame = recv_frame(stream)
+            if frame is None:
+                sys.stderr.write('hostcli daemon closed the connection\n')
+                return 1
+            if STDOUT in frame:
+                _write(sys.stdout, frame[STDOUT])
+            elif STDERR in frame:
+                _write(sys.stderr, frame[STDERR])
+            elif EXIT in frame:
+                return frame[EXIT]
+    finally:
+        stream.close()
+        sock.close()
+
+
+def main(argv=sys.argv[1:]):
+    # The interactive mode needs the terminal, so it is never forwarded
+    if argv and not os.environ.get('HOSTCLI_NO_DAEMON'):
+        sock = connect(socket_path())
+        if sock:
+            return forward(sock, argv)
+    from hostcli import main as hostcli_main
+    return hostcli_main.main(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
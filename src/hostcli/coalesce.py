@@ -0,0 +1,286 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Coalescing of identical GET requests in flight in several processes of the user
+    The processes meet at a lock file named after the request. The first one takes the lock
+    exclusively and sends the request, the others register as waiters and wait for the lock.
+    The body is copied to a file while the first process reads it, streamed or not. If there
+    were waiters, the response is published next to the lock file when the body is complete,
+    and the files are removed once the waiters have opened them.
+"""
+
+import errno
+import fcntl
+import itertools
+import logging
+import os
+import time
+
+import requests
+
+from hostcli import storage
+
+LOG = logging.getLogger(__name__)
+
+WAIT_TIMEOUT = 30       # seconds a process waits for the request of another one
+READ_TIMEOUT = 1        # seconds the first process waits for the waiters to open the body
+POLL_INTERVAL = 0.01    # seconds between the attempts to take the lock
+MAX_BODY_SIZE = 64 * 1024 * 1024    # bytes, a larger body is not shared
+MAX_AGE = 3600          # seconds after which the files left by a killed process are removed
+CHUNK_SIZE = 64 * 1024
+
+STORED = 'stored'
+BODY = 'body'
+# the body is stored decoded, so the headers describing the encoding on the wire are dropped
+WIRE_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+_bodies = itertools.count()
+
+
+def _lock(f, operation):
+    try:
+        fcntl.flock(f, operation | fcntl.LOCK_NB)
+        return True
+    except (IOError, OSError) as exp:
+        if exp.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+        return False
+
+
+def _count(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _mark(path):
+    # one byte per process, the appends of the processes do not overwrite each other
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        os.write(fd, b'.')
+    finally:
+        os.close(fd)
+
+
+class Share(object):
+    """The copy of the body of the response of the first process, published for the waiters when complete"""
+    def __init__(self, coalescer, key, lock):
+        self.coalescer = coalescer
+        self.paths = coalescer.paths(key)
+        self.lock = lock
+        self.name = '%s.%d-%d.body' % (key, os.getpid(), next(_bodies))
+        self.body_path = os.path.join(coalescer.path, self.name)
+        self.body = os.fdopen(os.open(self.body_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb')
+        self.size = 0
+        self.finished = False
+
+    def write(self, chunk):
+        if self.body is None:
+            return
+        self.size += len(chunk)
+        if self.size > MAX_BODY_SIZE:
+            LOG.debug('The body is too large to be shared')
+            self.body.close()
+            self.body = None
+            return
+        self.body.write(chunk)
+
+    def finish(self, response, complete):
+        if self.finished:
+            return
+        self.finished = True
+        waiters = _count(self.paths['waiters'])
+        shared = complete and self.body is not None and waiters > 0
+        if self.body is not None:
+            self.body.close()
+        if shared:
+            headers = dict((k, v) for k, v in response.headers.items() if k.lower() not in WIRE_HEADERS)
+            storage.write_json(self.paths['record'], {'url': response.url,
+                                                      'status': response.status_code,
+                                                      'reason': response.reason,
+                                                      'headers': headers,
+                                                      BODY: self.name,
+                                                      STORED: time.time()})
+        else:
+            storage.remove(self.body_path)
+        fcntl.flock(self.lock, fcntl.LOCK_UN)
+        try:
+            if shared:
+                self.clean_up(waiters)
+        finally:
+            self.lock.close()
+
+    def clean_up(self, waiters):
+        """Remove the files once the waiters have opened them, an open file can still be read"""
+        deadline = time.time() + READ_TIMEOUT
+        while _count(self.paths['readers']) < waiters and time.time() < deadline:
+            time.sleep(POLL_INTERVAL)
+        storage.remove(self.body_path)
+        # unless another process is already sending the request again
+        if _lock(self.lock, fcntl.LOCK_EX):
+            record = storage.read_json(self.paths['record'])
+            if record and record.get(BODY) == self.name:
+                for kind in ('record', 'waiters', 'readers'):
+                    storage.remove(self.paths[kind])
+            fcntl.flock(self.lock, fcntl.LOCK_UN)
+
+
+class TeeRaw(object):
+    """Wraps the raw stream of a response, copying the decoded body to the share while it is read"""
+    def __init__(self, raw, share, response):
+        self._raw = raw
+        self._share = share
+        self._response = response
+
+    def stream(self, amt=CHUNK_SIZE, decode_content=True):
+        complete = False
+        try:
+            for chunk in self._raw.stream(amt, decode_content=True):
+                self._share.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            self._share.finish(self._response, complete)
+
+    def read(self, amt=None, **kwargs):
+        kwargs['decode_content'] = True
+        data = self._raw.read(amt, **kwargs)
+        if data:
+            self._share.write(data)
+        else:
+            self._share.finish(self._response, True)
+        return data
+
+    def close(self):
+        self._share.finish(self._response, False)
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class Coalescer(object):
+    """Lets one process send a GET request while the others sending the same one wait for its response"""
+    def __init__(self, path=None, wait_timeout=WAIT_TIMEOUT):
+        self.path = path or storage.private_dir('inflight')
+        self.wait_timeout = wait_timeout
+        self.shared = 0
+        if self.path:
+            self.clean_up()
+
+    def clean_up(self):
+        now = time.time()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                if now - os.path.getmtime(path) > MAX_AGE:
+                    storage.remove(path)
+            except OSError:
+                pass
+
+    def paths(self, key):
+        return dict((kind, os.path.join(self.path, '%s.%s' % (key, kind)))
+                    for kind in ('lock', 'record', 'waiters', 'readers'))
+
+    def run(self, key, send, stream=False):
+        """Returns the response of send, or that of the same request sent by another process meanwhile"""
+        if not self.path:
+            return send()
+        paths = self.paths(key)
+        since = time.time()
+        deadline = since + self.wait_timeout
+        lock = os.fdopen(os.open(paths['lock'], os.O_RDWR | os.O_CREAT, 0o600), 'r+')
+        try:
+            while True:
+                if _lock(lock, fcntl.LOCK_EX):
+                    response = self._published(paths, since, stream)
+                    if response is not None:
+                        # the request completed while this process was about to take the lock
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+                        lock.close()
+                        return response
+                    for kind in ('waiters', 'readers'):
+                        storage.remove(paths[kind])
+                    os.utime(paths['lock'], None)
+                    return self._send(key, lock, send, stream)
+                # another process is sending the request, wait for it to release the lock
+                _mark(paths['waiters'])
+                while time.time() < deadline and not _lock(lock, fcntl.LOCK_SH):
+                    time.sleep(POLL_INTERVAL)
+                if time.time() >= deadline:
+                    _mark(paths['readers'])
+                    LOG.debug('Gave up waiting for the request of another process')
+                    lock.close()
+                    return send()
+                try:
+                    response = self._published(paths, since, stream)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+                    _mark(paths['readers'])
+                if response is not None:
+                    lock.close()
+                    return response
+                # the other process failed or did not share the response, take over the request
+        except BaseException:
+            lock.close()
+            raise
+
+    def _send(self, key, lock, send, stream):
+        try:
+            share = Share(self, key, lock)
+        except (IOError, OSError) as exp:
+            LOG.debug('Cannot share the response: %s', exp)
+            share = None
+        try:
+            response = send()
+        except BaseException:
+            if share:
+                share.finish(None, False)
+            else:
+                lock.close()
+            raise
+        if share is None:
+            lock.close()
+        elif stream and response.ok and not response._content_consumed:
+            # the waiters get the body when the caller has read all of it
+            response.raw = TeeRaw(response.raw, share, response)
+        else:
+            share.write(response.content)
+            share.finish(response, True)
+        return response
+
+    def _published(self, paths, since, stream):
+        """Returns the response published after since, or None"""
+        record = storage.read_json(paths['record'])
+        if not record or record.get(STORED, 0) < since:
+            return None
+        try:
+            body = open(os.path.join(self.path, record[BODY]), 'rb')
+        except (IOError, OSError):
+            return None
+        response = requests.Response()
+        response.url = record['url']
+        response.status_code = record['status']
+        response.reason = record['reason']
+        response.headers = requests.structures.CaseInsensitiveDict(record['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = body
+        if not stream:
+            with body:
+                response.content
+        LOG.debug('Using the response received by another process')
+        self.shared += 1
+        return response
@@ -0,0 +1,116 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import importlib
+import logging
+import os
+import sys
+
+from cliff import commandmanager
+from cliff import complete
+
+from hostcli import storage
+
+LOG = logging.getLogger(__name__)
+
+SIGNATURE = 'signature'
+COMMANDS = 'commands'
+ACTIONS = 'actions'
+
+
+class EntryPoint(object):
+    """Entry point of the command index, the command module is imported only when it is loaded"""
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def resolve(self):
+        module, _, attrs = self.value.partition(':')
+        obj = importlib.import_module(module.strip())
+        for attr in attrs.strip().split('.') if attrs.strip() else []:
+            obj = getattr(obj, attr)
+        return obj
+
+    def load(self, *args, **kwargs):
+        return self.resolve()
+
+
+def _signature():
+    # Installing, upgrading or removing a package changes the mtime of its site directory
+    signature = []
+    for path in sys.path:
+        try:
+            signature.append([path, os.stat(path or '.').st_mtime])
+        except OSError:
+            pass
+    return signature
+
+
+def _scan(namespace):
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+        return dict((ep.name, '%s:%s' % (ep.module_name, '.'.join(ep.attrs)))
+                    for ep in pkg_resources.iter_entry_points(namespace))
+    eps = metadata.entry_points()
+    eps = eps.select(group=namespace) if hasattr(eps, 'select') else eps.get(namespace, [])
+    return dict((ep.name, ep.value) for ep in eps)
+
+
+class CommandManager(commandmanager.CommandManager):
+    """ CommandManager reading the commands from a cached index instead of scanning the entry points
+        The index is rebuilt when the mtime of any directory on sys.path changes. Besides the
+        entry points it holds the options of the commands collected for the bash completion.
+    """
+    def load_commands(self, namespace):
+        self.group_list.append(namespace)
+        self.index_path = None
+        directory = storage.private_dir('index')
+        if directory:
+            self.index_path = os.path.join(directory, '%s.json' % namespace)
+        signature = _signature()
+        self.index = storage.read_json(self.index_path) if self.index_path else None
+        if not self.index or self.index.get(SIGNATURE) != signature:
+            LOG.debug('Building command index of %s', namespace)
+            self.index = {SIGNATURE: signature, COMMANDS: _scan(namespace), ACTIONS: {}}
+            self.save_index()
+        for name, value in self.index[COMMANDS].items():
+            cmd_name = name.replace('_', ' ') if self.convert_underscores else name
+            self.commands[cmd_name] = EntryPoint(name, value)
+
+    def save_index(self):
+        if self.index_path:
+            storage.write_json(self.index_path, self.index)
+
+
+class Action(object):
+    """The part of an argparse action needed by the bash completion"""
+    def __init__(self, option_strings):
+        self.option_strings = option_strings
+
+
+class CompleteCommand(complete.CompleteCommand):
+    """complete command taking the options of the commands from the command index"""
+    def get_actions(self, command):
+        manager = self.app.command_manager
+        actions = getattr(manager, 'index', {}).get(ACTIONS)
+        if actions is None:
+            return super(CompleteCommand, self).get_actions(command)
+        name = ' '.join(command)
+        if name not in actions:
+            actions[name] = [a.option_strings for a in super(CompleteCommand, self).get_actions(command)]
+            manager.save_index()
+        return [Action(o) for o in actions[name]]
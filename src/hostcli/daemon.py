@@ -0,0 +1,172 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import argparse
+import importlib
+import io
+import logging
+import os
+import sys
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from hostcli import client
+from hostcli import app as hostcli_app
+from hostcli import timing
+from hostcli import tokencache
+
+LOG = logging.getLogger(__name__)
+
+PRELOAD = ('osc_lib.shell',
+           'osc_lib.clientmanager',
+           'osc_lib.api.auth',
+           'osc_lib.cli.client_config',
+           'keystoneauth1.exceptions.http',
+           'cliff.lister',
+           'cliff.show',
+           'requests',
+           'hostcli.helper')
+
+
+class FrameWriter(object):
+    """File like object sending everything written to it to the client as frames of one kind"""
+    encoding = 'utf-8'
+
+    def __init__(self, stream, kind):
+        self.stream = stream
+        self.kind = kind
+
+    def write(self, text):
+        if text:
+            client.send_frame(self.stream, {self.kind: text})
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = client.recv_frame(self.rfile)
+        if request is None:
+            return
+        # the command runs in a forked child, so its environment does not leak into the next ones
+        try:
+            os.environ.clear()
+            os.environ.update(request['env'])
+            os.chdir(request['cwd'])
+            time.tzset()
+            code = self.server.run(request['argv'],
+                                   io.StringIO(request['stdin'] or u''),
+                                   FrameWriter(self.wfile, client.STDOUT),
+                                   FrameWriter(self.wfile, client.STDERR))
+        except Exception as exp:
+            LOG.exception('Failed to run %s', request['argv'])
+            client.send_frame(self.wfile, {client.STDERR: 'hostcli daemon failed with error:\n%s\n' % exp})
+            code = 1
+        client.send_frame(self.wfile, {client.EXIT: code})
+
+
+class Daemon(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """ Resident hostcli process
+        Every command runs in a child forked from the daemon, so the modules are already
+        imported, and long commands like --watch do not hold back the others. With token_cache
+        set, the keystone tokens are shared by the children through the token cache of the user.
+    """
+    def __init__(self, path, idle_timeout=0, token_cache=False):
+        self.token_cache = tokencache.TokenCache() if token_cache else None
+        self.timeout = idle_timeout or None
+        self.idle = False
+        old_umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def handle_timeout(self):
+        self.collect_children()
+        # a running command keeps the daemon alive
+        if not self.active_children:
+            self.idle = True
+
+    def run(self, argv, stdin, stdout, stderr):
+        timing.reset()
+        app = hostcli_app.HOSTCLI(stdin=stdin, stdout=stdout, stderr=stderr, token_cache=self.token_cache)
+        try:
+            return app.run(argv)
+        except SystemExit as exp:
+            return exp.code if isinstance(exp.code, int) else 1
+
+
+def preload():
+    """Import the modules needed by the commands once, before the children are forked"""
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except ImportError as exp:
+            LOG.debug('Cannot preload %s: %s', name, exp)
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Resident hostcli server')
+    parser.add_argument('--socket',
+                        default=client.socket_path(),
+                        help='Unix socket to listen on (Env: HOSTCLI_DAEMON_SOCKET)')
+    parser.add_argument('--idle-timeout',
+                        type=int,
+                        default=0,
+                        help='Exit after this many seconds without commands, 0 means never')
+    parser.add_argument('--token-cache',
+                        action='store_true',
+                        default=bool(os.environ.get('HOSTCLI_TOKEN_CACHE')),
+                        help='Share the keystone tokens of the commands through the token cache of the user, '
+                             'like --os-token-cache (Env: HOSTCLI_TOKEN_CACHE)')
+    args = parser.parse_args(argv)
+
+    sock = client.connect(args.socket)
+    if sock:
+        sock.close()
+        sys.stderr.write('hostcli daemon is already listening on %s\n' % args.socket)
+        return 1
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    if not os.path.isdir(os.path.dirname(args.socket)):
+        os.makedirs(os.path.dirname(args.socket), 0o700)
+
+    preload()
+    server = Daemon(args.socket, args.idle_timeout, args.token_cache)
+    try:
+        if args.idle_timeout:
+            while not server.idle:
+                server.handle_request()
+                server.collect_children()
+        else:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
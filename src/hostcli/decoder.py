@@ -0,0 +1,164 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import codecs
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DATA = 'data'
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+MSGPACK_TYPES = (MSGPACK, 'application/msgpack')
+WHITESPACE = ' \t\n\r'
+CHUNK_SIZE = 64 * 1024
+
+
+class JSONStream(object):
+    """Incremental reader of a JSON document arriving in chunks, only the unparsed tail is kept in memory"""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = u''
+        self.pos = 0
+
+    def _more(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + self.utf8.decode(chunk)
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        """Return the next non whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                raise ValueError('Unexpected end of JSON document')
+
+    def expect(self, chars):
+        c = self.peek()
+        if c not in chars:
+            raise ValueError('Expecting one of "%s" at "%s"' % (chars, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._more():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._more():
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Yield the keys of the object starting at the current position, the caller must consume the values"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+
+def iter_json_items(chunks, result):
+    """ Yield the (key, value) pairs of the data object of a JSON response as soon as they arrive
+        The other members of the top level object are stored into result.
+    """
+    stream = JSONStream(chunks)
+    for key in stream.members():
+        if key == DATA and stream.peek() == '{':
+            for k in stream.members():
+                yield k, stream.value()
+        else:
+            result[key] = stream.value()
+    # read to the end of the body, so the connection is released and the body is complete
+    for chunk in stream.chunks:
+        pass
+
+
+class ChunkReader(object):
+    """File like object reading the chunks of a response"""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = b''
+
+    def read(self, size=-1):
+        if not self.buf:
+            self.buf = next(self.chunks, b'')
+        if size < 0:
+            size = len(self.buf)
+        data = self.buf[:size]
+        self.buf = self.buf[size:]
+        return data
+
+
+def iter_msgpack_items(chunks, result):
+    """ Yield the (key, value) pairs of the data map of a msgpack response as soon as they arrive
+        The other members of the top level map are stored into result.
+    """
+    reader = ChunkReader(chunks)
+    unpacker = msgpack.Unpacker(reader, raw=False)
+    for i in range(unpacker.read_map_header()):
+        key = unpacker.unpack()
+        if key == DATA:
+            for j in range(unpacker.read_map_header()):
+                k = unpacker.unpack()
+                yield k, unpacker.unpack()
+        else:
+            result[key] = unpacker.unpack()
+    for chunk in reader.chunks:
+        pass
+
+
+def is_msgpack(response):
+    return response.headers.get('Content-Type', '').split(';')[0].strip() in MSGPACK_TYPES
+
+
+def accept():
+    """Value of the Accept header, msgpack is preferred when it can be decoded"""
+    return '%s, %s;q=0.9' % (MSGPACK, JSON) if msgpack else JSON
+
+
+def decode(response, **kwargs):
+    """Decode a JSON or a msgpack response, depending on its Content-Type"""
+    if msgpack and is_msgpack(response):
+        return msgpack.unpackb(response.content, raw=False, **kwargs)
+    return response.json(**kwargs)
+
+
+def iter_items(response, result):
+    if msgpack and is_msgpack(response):
+        return iter_msgpack_items(response.iter_content(CHUNK_SIZE), result)
+    return iter_json_items(response.iter_content(CHUNK_SIZE), result)
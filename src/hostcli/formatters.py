@@ -0,0 +1,121 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" List formatters writing the rows while they are produced, selected with -f
+    Unlike the cliff table formatter, they do not hold the whole output in memory, so the
+    rows of the streamed listings are written as they arrive.
+"""
+
+import itertools
+import json
+import numbers
+import os
+
+from cliff import columns
+from cliff.formatters import base
+
+BUFFER_SIZE = 64 * 1024     # characters written to the output at once
+SAMPLE_ROWS = 1000          # rows the widths of the stream-table columns are computed from
+
+
+def _value(value):
+    if isinstance(value, columns.FormattableColumn):
+        return value.machine_readable()
+    return value
+
+
+def _text(value):
+    if isinstance(value, columns.FormattableColumn):
+        value = value.human_readable()
+    # one line per row, so the table stays aligned
+    return u' '.join((u'%s' % value).splitlines())
+
+
+class BufferedWriter(object):
+    """Collects the written text and passes it on to the output in pieces of about size characters"""
+    def __init__(self, stdout, size=BUFFER_SIZE):
+        self.stdout = stdout
+        self.size = size
+        self.parts = []
+        self.length = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.stdout.write(''.join(self.parts))
+            self.parts = []
+            self.length = 0
+        self.stdout.flush()
+
+
+class NDJSONFormatter(base.ListFormatter):
+    """One JSON object per row and line, keyed by the column names"""
+    def add_argument_group(self, parser):
+        pass
+
+    def emit_list(self, column_names, data, stdout, parsed_args):
+        out = BufferedWriter(stdout)
+        for row in data:
+            out.write(json.dumps(dict(zip(column_names, (_value(v) for v in row))), default=str) + '\n')
+        out.flush()
+
+
+class StreamTableFormatter(base.ListFormatter):
+    """ Table whose column widths are computed from the first rows only
+        The later rows are written as they come, a value wider than its column widens
+        only its own row.
+    """
+    def add_argument_group(self, parser):
+        group = parser.add_argument_group('stream-table formatter')
+        group.add_argument('--sample-rows',
+                           metavar='<integer>',
+                           type=int,
+                           default=int(os.environ.get('HOSTCLI_SAMPLE_ROWS', SAMPLE_ROWS)),
+                           help='Number of the first rows the widths of the columns are computed from '
+                                '(Env: HOSTCLI_SAMPLE_ROWS)')
+
+    def emit_list(self, column_names, data, stdout, parsed_args):
+        rows = iter(data)
+        sample = list(itertools.islice(rows, max(1, getattr(parsed_args, 'sample_rows', SAMPLE_ROWS))))
+        if not sample:
+            return
+        # numeric columns are aligned to the right, like in the cliff table
+        right = []
+        for i in range(len(column_names)):
+            values = [_value(r[i]) for r in sample if r[i] is not None]
+            right.append(bool(values) and all(isinstance(v, numbers.Number) for v in values))
+        sample = [[_text(v) for v in row] for row in sample]
+        widths = [max([len(name)] + [len(row[i]) for row in sample]) for i, name in enumerate(column_names)]
+        separator = '+' + '+'.join('-' * (w + 2) for w in widths) + '+\n'
+
+        def line(values, alignments=right):
+            cells = [v.rjust(w) if r else v.ljust(w) for v, w, r in zip(values, widths, alignments)]
+            return '| ' + ' | '.join(cells) + ' |\n'
+
+        out = BufferedWriter(stdout)
+        out.write(separator)
+        out.write(line([u'%s' % name for name in column_names], [False] * len(widths)))
+        out.write(separator)
+        for row in sample:
+            out.write(line(row))
+        for row in rows:
+            out.write(line([_text(v) for v in row]))
+        out.write(separator)
+        out.flush()
@@ -15,12 +15,27 @@
 
 import sys
 import re
+import time
+import heapq
+import itertools
+import logging
+import numbers
+from collections import OrderedDict
 from datetime import datetime
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+from operator import itemgetter
 from dateutil import tz
 from cliff.show import ShowOne
 from cliff.lister import Lister
 from cliff.command import Command
 
+from hostcli import decoder
+from hostcli import resthandler
+from hostcli import timing
+from hostcli import where
+
+LOG = logging.getLogger(__name__)
 
 DEFAULT = 'default'
 ALL = 'all'
@@ -36,6 +51,129 @@ DETAILED = 'detailed'   # Makes the command to show all accessible details of th
                         # Should not be positional (so should not be the first in the arguments list)
 TIME = 'time'
 UTC = 'utc'
+LIMIT = 'limit'         # maximum number of entries shown, also the page size parameter of the paginated queries
+PAGE_SIZE = 'page_size' # number of entries requested in one page of a paginated query
+MARKER = 'marker'       # query parameter holding the key of the last entry of the previous page
+PAGE = 'page'           # query parameter holding the number of the requested page, starting from 1
+WATCH = 'watch'         # seconds between the polls of a watched listing
+WHERE = 'where'         # expression filtering the entries of a listing
+GROUP_BY = 'group_by'   # columns whose distinct values the entries of a listing are counted by
+COUNT = 'count'         # show only the number of the entries of a listing
+STARTTIME = 'starttime'
+CHANGE = 'Change'
+COUNT_HEADER = 'Count'
+CLOUD = 'cloud'         # column added to the rows of a listing queried from several clouds
+ADDED = '+'
+CHANGED = '~'
+REMOVED = '-'
+
+
+ISO_UTC = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?)?$')
+EPOCH = datetime(1970, 1, 1)
+OFFSET_SLOT = 900   # seconds, every DST transition happens at a quarter hour boundary
+
+
+class LocalTimeConverter(object):
+    """ Converts UTC timestamps to local time exactly like HelperBase.convert_utc_to_timezone_generic
+        The common ISO-8601 forms are parsed without strptime, the UTC offset of the local zone
+        is cached per 15 minutes of UTC time, and the results of repeated timestamps are memoized.
+    """
+    MEMO_SIZE = 65536
+
+    def __init__(self):
+        self.utc = tz.tzutc()
+        self.local = tz.tzlocal()
+        self.offsets = {}
+        self.memo = {}
+
+    def offset(self, utc):
+        slot = int((utc - EPOCH).total_seconds() // OFFSET_SLOT)
+        offset = self.offsets.get(slot)
+        if offset is None:
+            start = EPOCH + timedelta(seconds=slot * OFFSET_SLOT)
+            offset = self.offsets[slot] = start.replace(tzinfo=self.utc).astimezone(self.local).utcoffset()
+        return offset
+
+    def __call__(self, timestr):
+        result = self.memo.get(timestr)
+        if result is None:
+            result = self.convert(timestr)
+            if len(self.memo) >= self.MEMO_SIZE:
+                self.memo.clear()
+            self.memo[timestr] = result
+        return result
+
+    def convert(self, timestr):
+        m = ISO_UTC.match(timestr.replace('Z', '')[:26])
+        if not m:
+            return HelperBase.convert_utc_to_timezone_generic(timestr)
+        year, month, day, hour, minute, second, fraction = m.groups()
+        try:
+            # the result has millisecond resolution, the rest of the fraction is dropped
+            utc = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                           int((fraction or '0').ljust(3, '0')[:3]) * 1000)
+        except ValueError:
+            return HelperBase.convert_utc_to_timezone_generic(timestr)
+        local = utc + self.offset(utc)
+        return '%04d-%02d-%02d %02d:%02d:%02d.%03d' % (local.year, local.month, local.day,
+                                                       local.hour, local.minute, local.second,
+                                                       local.microsecond // 1000)
+
+
+_converters = {}
+
+
+def local_time_converter():
+    """Returns the LocalTimeConverter of the current local timezone"""
+    key = (time.timezone, time.altzone, time.tzname)
+    converter = _converters.get(key)
+    if converter is None:
+        converter = _converters[key] = LocalTimeConverter()
+    return converter
+
+
+_TEXT = (type(u''), str)
+
+
+def _sort_value(value):
+    # makes values of any type comparable: numbers, then strings, then anything else and None at the end
+    if value is None:
+        return 3, 0
+    if isinstance(value, numbers.Number):
+        return 0, value
+    if isinstance(value, _TEXT):
+        return 1, value
+    return 2, str(value)
+
+
+def _sort_column(values):
+    """Returns the values of a column, made comparable with _sort_value only if they hold None or mixed types"""
+    kinds = set(map(type, values))
+    if all(issubclass(k, numbers.Number) for k in kinds) or all(issubclass(k, _TEXT) for k in kinds):
+        return values
+    try:
+        # a column holding None, like a severity, has few distinct values
+        normalized = dict((v, _sort_value(v)) for v in set(values))
+    except TypeError:
+        return [_sort_value(v) for v in values]
+    return [normalized[v] for v in values]
+
+
+def _descending(column):
+    """Returns the negated ranks of the values of a column, which sort ascending in the descending order"""
+    ranks = dict((v, -i) for i, v in enumerate(sorted(set(column))))
+    return [ranks[v] for v in column]
+
+
+class Schema(object):
+    """Lookup tables derived from the fieldmap of a helper class, built once per class"""
+    def __init__(self, fieldmap):
+        self.size = len(fieldmap)
+        self.keys = {}
+        for k, v in fieldmap.items():
+            if DISPLAY in v:
+                self.keys.setdefault(v[DISPLAY], k)
+        self.converters = dict((k, CONVERTERS[k]) for k in fieldmap if k in CONVERTERS)
 
 
 class HelperBase(object):
@@ -54,6 +192,55 @@ class HelperBase(object):
         self.resource_prefix = ''
         self.default_sort = None
         self.positional_count = 1 # how many mandatory arguments are
+        self.fanout = None # argument whose comma separated values are queried with parallel requests
+        self.streaming = True # rows of unsorted listings are produced while the response is being received
+        self.pagination = None # e.g. {LIMIT: 'limit', MARKER: 'marker'} or {LIMIT: 'limit', PAGE: 'page'}
+        self.page_size = 1000
+        self.cache_ttl = 0 # seconds a response of a get operation may be served from the response cache
+        self.upload = None # argument holding the path of a file streamed as the request body
+        self.compress_upload = False # gzip the uploaded file, only for servers accepting Content-Encoding: gzip
+        self.where = None # predicate compiled from the --where expression
+        self.needed_keys = set() # keys read by --where and --group-by, requested even if not shown
+
+    @property
+    def schema(self):
+        schema = _schemas.get(type(self))
+        if schema is None or schema.size != len(self.fieldmap):
+            schema = _schemas[type(self)] = Schema(self.fieldmap)
+        return schema
+
+    def get_row_projector(self, parsed_args):
+        """Returns a function building the row of the shown columns from an entry of the data"""
+        columns = self.columns
+        if not columns:
+            return lambda entry: []
+        getter = itemgetter(*columns)
+        converters = self.schema.converters
+        if getattr(parsed_args, UTC, False):
+            converters = dict((k, f) for k, f in converters.items() if k != TIME)
+        converters = [(i, converters[c]()) for i, c in enumerate(columns) if c in converters]
+        if len(columns) == 1:
+            if converters:
+                convert = converters[0][1]
+                return lambda entry: [convert(getter(entry))]
+            return lambda entry: [getter(entry)]
+        if not converters:
+            return lambda entry: list(getter(entry))
+
+        def project(entry):
+            row = list(getter(entry))
+            for i, convert in converters:
+                row[i] = convert(row[i])
+            return row
+        return project
+
+    def get_cached_parser(self, prog_name, build):
+        """Returns the parser of the command class, it is built only once, e.g. in the interactive mode"""
+        key = (type(self), prog_name)
+        parser = _parsers.get(key)
+        if parser is None:
+            parser = _parsers[key] = build(prog_name)
+        return parser
 
     def get_parser_with_arguments(self, parser):
         args = self.arguments[:]
@@ -87,27 +274,243 @@ class HelperBase(object):
                                 type=str,
                                 choices=self.fieldmap[e].get(CHOICES, None),
                                 help=self.fieldmap[e][HELP] + multichoices)
+        if self.pagination:
+            parser.add_argument('--page-size',
+                                dest=PAGE_SIZE,
+                                metavar='PAGE_SIZE',
+                                type=int,
+                                default=self.page_size,
+                                help='Number of entries requested from the server at a time')
         return parser
 
-    def send_receive(self, app, parsed_args):
+    def get_limit(self, parsed_args):
+        return None if LIMIT in self.arguments else getattr(parsed_args, LIMIT, None)
+
+    def get_request_arguments(self, parsed_args):
         parsed_args = self.validate_parameters(parsed_args)
-        if parsed_args.fields:
+        # called on every poll of --watch, FIELDS is added once
+        if parsed_args.fields and FIELDS not in self.arguments:
             self.arguments.append(FIELDS)
         arguments = {k: v for k, v in sorted(vars(parsed_args).items()) if k in self.arguments and
                                                                            k != COLUMNS and
                                                                            v != ALL and
                                                                            v is not False}
-        if not arguments:
-            arguments = None
+        if self.needed_keys and FIELDS in arguments:
+            arguments[FIELDS] = ','.join(sorted(set(arguments[FIELDS].split(',')) | self.needed_keys))
+        return arguments or None
+
+    def send_receive(self, app, parsed_args):
+        arguments = self.get_request_arguments(parsed_args)
+        page_size = getattr(parsed_args, PAGE_SIZE, self.page_size)
+        if getattr(app, 'cloud_managers', None):
+            if not isinstance(self, Lister):
+                raise Exception('Only the list commands can be run against several clouds')
+            return self.send_receive_clouds(app, arguments, page_size)
+        return self.query(app.client_manager.resthandler, arguments, page_size)
+
+    def query(self, req, arguments, page_size=None):
+        if self.fanout and arguments and ',' in str(arguments.get(self.fanout, '')):
+            return self.send_receive_fanout(req, arguments)
+        if self.upload:
+            return self.send_file(req, arguments)
+        if self.pagination:
+            # the limit is applied after sorting, so every page is needed
+            pages = self.send_receive_pages(req, arguments, page_size or self.page_size, None)
+            return {'code': 0, 'description': '', DATA: OrderedDict(pages)}
+        response = req._operation(self.operation,
+                                  '%s%s' %(self.resource_prefix, self.endpoint),
+                                  arguments if self.usebody else None,
+                                  None if self.usebody else arguments,
+                                  False,
+                                  cache_ttl=self.cache_ttl,
+                                  decoded=True)
+        return HelperBase.check_response(response)
+
+    def send_receive_clouds(self, app, arguments, page_size=None):
+        """ Run the query against every cloud concurrently and merge the data, keyed by cloud/key
+            A cloud failing or not answering within the timeout is reported on the standard error,
+            the command fails only if every cloud failed.
+        """
+        if arguments and FIELDS in arguments:
+            # the cloud column is added here, the servers do not know it
+            fields = [f for f in arguments[FIELDS].split(',') if f != CLOUD]
+            arguments = dict(arguments)
+            if fields:
+                arguments[FIELDS] = ','.join(fields)
+            else:
+                del arguments[FIELDS]
+        clouds = app.cloud_managers
+        timeout = app.options.clouds_timeout
+        started = {}
+
+        def query(name, manager):
+            started[name] = time.time()
+            # authenticates to the cloud, so the clouds authenticate concurrently too
+            req = resthandler.make_instance(manager)
+            return self.query(req, arguments, page_size)
+
+        pool = ThreadPool(max(1, min(len(clouds), app.options.clouds_parallel)))
+        pending = [(name, pool.apply_async(query, (name, manager))) for name, manager in clouds]
+        pool.close()
+        data = OrderedDict()
+        errors = []
+        for name, result in pending:
+            while not result.ready():
+                if name in started and time.time() - started[name] > timeout:
+                    break
+                result.wait(0.1)
+            if not result.ready():
+                errors.append('%s: no response in %s seconds' % (name, timeout))
+                continue
+            try:
+                entries = result.get()[DATA]
+            except Exception as exp:
+                errors.append('%s: %s' % (name, str(exp)))
+                continue
+            for k, v in entries.items():
+                v = dict(v)
+                v[CLOUD] = name
+                data['%s/%s' % (name, k)] = v
+        if errors:
+            if len(errors) == len(clouds):
+                raise Exception('\n'.join(errors))
+            app.stderr.write('Failed clouds:\n%s\n' % '\n'.join(errors))
+        return {'code': 0, 'description': '', DATA: data}
+
+    def add_cloud_column(self):
+        """Show the cloud of the rows of a listing queried from several clouds as the first column"""
+        if CLOUD not in self.fieldmap:
+            self.fieldmap[CLOUD] = {DISPLAY: 'Cloud', HELP: 'Name of the cloud in clouds.yaml'}
+        if CLOUD not in self.columns:
+            self.columns.insert(0, CLOUD)
+
+    def send_receive_stream(self, app, parsed_args):
+        """Like send_receive, but returns an iterator of the (key, value) pairs of the data decoded as they arrive"""
+        arguments = self.get_request_arguments(parsed_args)
         req = app.client_manager.resthandler
+        if self.fanout and arguments and ',' in str(arguments.get(self.fanout, '')):
+            return iter(self.send_receive_fanout(req, arguments)[DATA].items())
+        if self.pagination:
+            # the limit applies to the filtered entries or to the groups
+            limit = None if self.where or self.is_aggregated(parsed_args) else self.get_limit(parsed_args)
+            return self.send_receive_pages(req, arguments, parsed_args.page_size, limit)
         response = req._operation(self.operation,
                                   '%s%s' %(self.resource_prefix, self.endpoint),
                                   arguments if self.usebody else None,
                                   None if self.usebody else arguments,
-                                  False)
+                                  False,
+                                  stream=True,
+                                  cache_ttl=self.cache_ttl,
+                                  decoded=True)
+        if not response.ok:
+            raise Exception('Request response is not OK (%s)' % response.reason)
+        result = {}
+        return HelperBase.check_stream(decoder.iter_items(response, result), result)
+
+    @staticmethod
+    def check_stream(items, result):
+        """Pass the streamed items through, failing as soon as the response reports an error"""
+        for item in items:
+            if 0 != result.get('code', 0):
+                break
+            yield item
+        if 0 != result.get('code'):
+            raise Exception(result.get('description', 'Invalid response'))
+
+    def send_file(self, req, arguments):
+        """Stream the file named by the upload argument as the body, the other arguments are sent as parameters"""
+        arguments = dict(arguments or {})
+        with open(arguments.pop(self.upload), 'rb') as body:
+            response = req._operation(self.operation,
+                                      '%s%s' %(self.resource_prefix, self.endpoint),
+                                      body,
+                                      arguments or None,
+                                      False,
+                                      compress=self.compress_upload,
+                                      decoded=True)
+        return HelperBase.check_response(response)
+
+    def send_receive_pages(self, req, arguments, page_size, limit):
+        """ Yield the (key, value) pairs of the data of a paginated query, page after page
+            The next page is requested while the entries of the current one are being processed.
+        """
+        params = dict(arguments or {})
+        params[self.pagination[LIMIT]] = page_size
+        if PAGE in self.pagination:
+            params[self.pagination[PAGE]] = 1
+        pool = ThreadPool(1)
+        pending = pool.apply_async(self.fetch_page, (req, dict(params)))
+        count = 0
+        last = None
+        try:
+            while pending:
+                page = pending.get()[DATA]
+                pending = None
+                if page and next(reversed(page)) == last:
+                    # the server ignored the marker or the page number and sent the same page again
+                    LOG.warning('The page of %s did not move forward, stopping after %d entries', self.endpoint, count)
+                    return
+                last = next(reversed(page), None)
+                if len(page) >= page_size and (limit is None or count + len(page) < limit):
+                    if MARKER in self.pagination:
+                        params[self.pagination[MARKER]] = next(reversed(page))
+                    else:
+                        params[self.pagination[PAGE]] += 1
+                    pending = pool.apply_async(self.fetch_page, (req, dict(params)))
+                for k, v in page.items():
+                    if limit is not None and count >= limit:
+                        return
+                    count += 1
+                    yield k, v
+        finally:
+            pool.close()
+
+    def fetch_page(self, req, params):
+        response = req._operation(self.operation,
+                                  '%s%s' %(self.resource_prefix, self.endpoint),
+                                  params if self.usebody else None,
+                                  None if self.usebody else params,
+                                  False,
+                                  cache_ttl=self.cache_ttl,
+                                  decoded=True)
+        # the order of the entries is needed for the marker of the next page
+        return HelperBase.check_response(response, object_pairs_hook=OrderedDict)
+
+    def send_receive_fanout(self, req, arguments):
+        """Query every value of the fanout argument with a separate, concurrent request and merge the data"""
+        values = arguments[self.fanout].split(',')
+        calls = []
+        for v in values:
+            args = dict(arguments)
+            args[self.fanout] = v
+            calls.append((self.operation,
+                          '%s%s' %(self.resource_prefix, self.endpoint),
+                          args if self.usebody else None,
+                          None if self.usebody else args))
+        result = None
+        errors = []
+        for v, (response, error) in zip(values, req.operations(calls, decode_json=False, cache_ttl=self.cache_ttl, decoded=True)):
+            try:
+                if error:
+                    raise error
+                partial = HelperBase.check_response(response)
+            except Exception as exp:
+                errors.append('%s: %s' % (v, str(exp)))
+                continue
+            if result is None:
+                result = partial
+            else:
+                result[DATA].update(partial[DATA])
+        if errors:
+            raise Exception('\n'.join(errors))
+        return result
+
+    @staticmethod
+    def check_response(response, **kwargs):
         if not response.ok:
             raise Exception('Request response is not OK (%s)' % response.reason)
-        result = response.json()
+        with timing.span('decode'):
+            result = decoder.decode(response, **kwargs)
         if 0 != result['code']:
             raise Exception(result['description'])
         return result
@@ -152,6 +555,10 @@ class HelperBase(object):
 
     @staticmethod
     def convert_utc_to_timezone(timestr):
+        return local_time_converter()(timestr)
+
+    @staticmethod
+    def convert_utc_to_timezone_generic(timestr):
         timestr = timestr.replace('Z', '')
         # max resolution for strptime is microsec
         if len(timestr) > 26:
@@ -193,30 +600,116 @@ class HelperBase(object):
         if getattr(args, DETAILED, False) is True:
             self.columns.extend(self.detailed)
         if ALL != args.fields:
-            for i in range(len(self.columns) - 1, -1, -1):
-                if self.columns[i] not in args.fields:
-                    del self.columns[i]
+            fields = set(args.fields.split(','))
+            self.columns = [c for c in self.columns if c in fields]
         return [self.fieldmap[f][DISPLAY] for f in self.columns]
 
+    def resolve_column(self, name):
+        """Returns the key of the column given by its display name or by its key"""
+        if name not in self.schema.keys and name in self.fieldmap:
+            return name
+        return self.get_key_by_value(name)
+
+    def compile_where(self, parsed_args):
+        """Compile the --where expression once, the time values are given in local time unless --utc is set"""
+        expression = getattr(parsed_args, WHERE, None)
+        if not expression:
+            return
+        if getattr(parsed_args, UTC, False):
+            convert_time = lambda v: v if v.endswith('Z') else v + 'Z'
+        else:
+            convert_time = HelperBase.convert_timezone_to_utc
+        self.where, keys = where.compile_where(expression, self.resolve_column, (TIME,), convert_time)
+        self.needed_keys.update(keys)
+
+    def filter_items(self, items):
+        if self.where is None:
+            return items
+        predicate = self.where
+        return ((k, v) for k, v in items if predicate(v))
+
+    def filter_entries(self, entries):
+        if self.where is None:
+            return entries
+        with timing.span('filter'):
+            predicate = self.where
+            return OrderedDict((k, v) for k, v in entries.items() if predicate(v))
+
+    @staticmethod
+    def is_aggregated(parsed_args):
+        return bool(getattr(parsed_args, GROUP_BY, None) or getattr(parsed_args, COUNT, False))
+
+    def get_group_keys(self, parsed_args):
+        names = getattr(parsed_args, GROUP_BY, None)
+        if not names:
+            return []
+        keys = [self.resolve_column(n.strip()) for n in names.split(',') if n.strip()]
+        self.needed_keys.update(keys)
+        return keys
+
+    def aggregate(self, parsed_args, items, keys):
+        """Count the entries per distinct values of the group-by columns, the largest groups first"""
+        if not keys:
+            return [COUNT_HEADER], [[sum(1 for _ in items)]]
+        counts = OrderedDict()
+        with timing.span('aggregate'):
+            for k, v in items:
+                group = tuple(v.get(key) for key in keys)
+                try:
+                    counts[group] = counts.get(group, 0) + 1
+                except TypeError:
+                    # lists and dicts are counted by their text
+                    group = tuple(str(g) for g in group)
+                    counts[group] = counts.get(group, 0) + 1
+            groups = sorted(counts.items(), key=lambda g: -g[1])[:self.get_limit(parsed_args)]
+        self.columns = keys
+        project = self.get_row_projector(parsed_args)
+        rows = [project(dict(zip(keys, group))) + [count] for group, count in groups]
+        return [self.fieldmap[k][DISPLAY] for k in keys] + [COUNT_HEADER], rows
+
     def get_key_by_value(self, val):
-        for k, v in self.fieldmap.items():
-            if DISPLAY in v and val == v[DISPLAY]:
-                return k
-        raise Exception('No column named %s' % val)
-
-    def get_sorted_keys(self, parsed_args, data):
-        keylist = data.keys()
-        if hasattr(parsed_args, SORT):
-            sortexp = parsed_args.sort
-            if sortexp != ALL:
-                # The next one generates two lists, one with the field names (to be sorted),
-                # and another with the directions. True if reversed, false otherwise
-                # also if no direction is added for a field, then it adds an ':asc' by default.
-                skeys, sdir = zip(*[(self.get_key_by_value(x[0]), False if 'asc' in x[1].lower() else True)
-                                    for x in (('%s:asc' % x).split(":") for x in reversed(sortexp.split(',')))])
-                for k, d in zip(skeys, sdir):
-                    keylist.sort(key=lambda x: data[x][k], reverse=d)
-        return keylist
+        try:
+            return self.schema.keys[val]
+        except KeyError:
+            raise Exception('No column named %s' % val)
+
+    def get_sort_plan(self, parsed_args):
+        """Returns the list of (field name, reversed) pairs of the sort expression, the first is the primary key"""
+        sortexp = getattr(parsed_args, SORT, ALL)
+        if sortexp == ALL:
+            return []
+        # if no direction is added for a field, then it is sorted ascending
+        return [(self.get_key_by_value(x[0]), False if 'asc' in x[1].lower() else True)
+                for x in (('%s:asc' % x).split(":") for x in sortexp.split(','))]
+
+    def get_sorted_keys(self, parsed_args, data, limit=None):
+        keylist = list(data)
+        plan = self.get_sort_plan(parsed_args)
+        if not plan:
+            return keylist[:limit]
+        with timing.span('sort'):
+            return HelperBase.sort_keys(keylist, data, plan, limit)
+
+    @staticmethod
+    def sort_keys(keylist, data, plan, limit=None):
+        """ Sort the keys on the columns of the plan, or select the first limit keys with a heap
+            The values of a column are read once, see _sort_column, and the positions of the keys are
+            sorted once per column, the last one first, as the sort is stable.
+        """
+        columns = [(_sort_column([data[k][field] for k in keylist]), descending) for field, descending in plan]
+        order = list(range(len(keylist)))
+        if limit is not None:
+            if len(set(d for c, d in columns)) == 1:
+                select = heapq.nlargest if columns[0][1] else heapq.nsmallest
+            else:
+                select = heapq.nsmallest
+                columns = [(_descending(c) if d else c, d) for c, d in columns]
+            rows = list(zip(*[c for c, d in columns]))
+            order = select(limit, order, key=rows.__getitem__)
+        else:
+            for column, descending in reversed(columns):
+                order.sort(key=column.__getitem__, reverse=descending)
+        return [keylist[i] for i in order]
 
     @staticmethod
     def construct_message(text, result):
@@ -229,26 +722,106 @@ class HelperBase(object):
         return '%s\n' % text
 
 
+# factories of the converters applied on the values of the columns when a row is built, unless --utc is given
+CONVERTERS = {TIME: local_time_converter}
+_schemas = {}
+# the parsers of the command classes and the formatter plugins, built once per process
+_parsers = {}
+_formatters = {}
+
+
+def load_formatter_plugins(command, load):
+    plugins = _formatters.get(command.formatter_namespace)
+    if plugins is None:
+        plugins = _formatters[command.formatter_namespace] = load()
+    return plugins
+
+
 class ListerHelper(Lister, HelperBase):
     """Helper class for Lister"""
     def __init__(self, app, app_args, cmd_name=None):
         Lister.__init__(self, app, app_args, cmd_name)
         HelperBase.__init__(self)
 
+    def _load_formatter_plugins(self):
+        return load_formatter_plugins(self, super(ListerHelper, self)._load_formatter_plugins)
+
     def get_parser(self, prog_name):
+        return self.get_cached_parser(prog_name, self.build_parser)
+
+    def build_parser(self, prog_name):
         parser = super(ListerHelper, self).get_parser(prog_name)
+        if WHERE not in self.arguments:
+            parser.add_argument('--where',
+                                dest=WHERE,
+                                metavar='EXPRESSION',
+                                default=None,
+                                help='Show only the entries matching the expression, e.g. '
+                                     '"State = up and (Name ~ ^web or Time >= 2019-01-31T10:00)". '
+                                     'The operators are = != < <= > >= ~ (regular expression) !~')
+        if GROUP_BY not in self.arguments:
+            parser.add_argument('--group-by',
+                                dest=GROUP_BY,
+                                metavar='COLUMNS',
+                                default=None,
+                                help='Show the number of the entries per distinct values of the comma '
+                                     'separated columns, the largest groups first')
+        if (self.pagination or SORT in self.arguments) and LIMIT not in self.arguments:
+            parser.add_argument('--limit',
+                                dest=LIMIT,
+                                metavar='LIMIT',
+                                type=int,
+                                default=None,
+                                help='Maximum number of entries to show')
+        if COUNT not in self.arguments:
+            parser.add_argument('--count',
+                                dest=COUNT,
+                                action='store_true',
+                                help='Show only the number of the entries')
+        parser.add_argument('--watch',
+                            dest=WATCH,
+                            metavar='INTERVAL',
+                            type=float,
+                            default=None,
+                            help='Poll every INTERVAL seconds and show only the added (+), changed (~) '
+                                 'and removed (-) rows, until interrupted')
         return self.get_parser_with_arguments(parser)
 
+    def produce_output(self, parsed_args, column_names, data):
+        if getattr(parsed_args, WATCH, None):
+            # the output was already written while watching
+            return 0
+        with timing.span('format'):
+            return super(ListerHelper, self).produce_output(parsed_args, column_names, data)
+
     def take_action(self, parsed_args):
         try:
-            result = self.send_receive(self.app, parsed_args)
-            header = self.filter_columns(parsed_args)
-            data = []
-            for k in self.get_sorted_keys(parsed_args, result[DATA]):
-                row = [HelperBase.convert_utc_to_timezone(result[DATA][k][i])
-                       if not getattr(parsed_args, UTC, False) and i == TIME
-                       else result[DATA][k][i] for i in self.columns]
-                data.append(row)
+            clouds = getattr(self.app, 'cloud_managers', None)
+            if clouds:
+                self.add_cloud_column()
+            self.compile_where(parsed_args)
+            aggregated = self.is_aggregated(parsed_args)
+            group_keys = self.get_group_keys(parsed_args) if aggregated else None
+            if getattr(parsed_args, WATCH, None):
+                return self.watch(parsed_args)
+            if self.streaming and not clouds and (aggregated or getattr(parsed_args, SORT, ALL) == ALL):
+                items = self.filter_items(self.send_receive_stream(self.app, parsed_args))
+                if aggregated:
+                    header, data = self.aggregate(parsed_args, items, group_keys)
+                else:
+                    items = itertools.islice(items, self.get_limit(parsed_args))
+                    header = self.filter_columns(parsed_args)
+                    data = self.stream_rows(parsed_args, items)
+            else:
+                result = self.send_receive(self.app, parsed_args)
+                entries = self.filter_entries(result[DATA])
+                if aggregated:
+                    header, data = self.aggregate(parsed_args, entries.items(), group_keys)
+                else:
+                    header = self.filter_columns(parsed_args)
+                    project = self.get_row_projector(parsed_args)
+                    data = [project(entries[k])
+                            for k in self.get_sorted_keys(parsed_args, entries, self.get_limit(parsed_args))]
             if self.message:
                 self.app.stdout.write(self.message + '\n')
             return header, data
@@ -256,6 +829,52 @@ class ListerHelper(Lister, HelperBase):
             self.app.stderr.write('Failed with error:\n%s\n' % str(exp))
             sys.exit(1)
 
+    def watch(self, parsed_args):
+        """ Poll the endpoint and print the differences to the previous poll, keyed by the keys of the data
+            If the command has a starttime argument, only the entries since the previous poll are queried,
+            so the entries missing from a response are not reported as removed.
+        """
+        incremental = STARTTIME in self.arguments
+        header = None
+        previous = None
+        try:
+            while True:
+                polled = datetime.utcnow()
+                result = self.send_receive(self.app, parsed_args)
+                if header is None:
+                    header = self.filter_columns(parsed_args)
+                    project = self.get_row_projector(parsed_args)
+                entries = self.filter_entries(result[DATA])
+                current = OrderedDict((k, project(entries[k]))
+                                      for k in self.get_sorted_keys(parsed_args, entries, self.get_limit(parsed_args)))
+                if previous is None:
+                    self.formatter.emit_list(header, list(current.values()), self.app.stdout, parsed_args)
+                else:
+                    changes = [[ADDED if k not in previous else CHANGED] + row
+                               for k, row in current.items() if previous.get(k) != row]
+                    if not incremental:
+                        changes.extend([REMOVED] + row for k, row in previous.items() if k not in current)
+                    if changes:
+                        self.formatter.emit_list([CHANGE] + header, changes, self.app.stdout, parsed_args)
+                self.app.stdout.flush()
+                previous = current
+                if incremental:
+                    parsed_args.starttime = polled.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+                time.sleep(parsed_args.watch)
+        except KeyboardInterrupt:
+            pass
+        return header, []
+
+    def stream_rows(self, parsed_args, items):
+        """Build the rows lazily, while cliff is formatting the output"""
+        project = self.get_row_projector(parsed_args)
+        try:
+            for k, v in items:
+                yield project(v)
+        except Exception as exp:
+            self.app.stderr.write('Failed with error:\n%s\n' % str(exp))
+            sys.exit(1)
+
 
 class ShowOneHelper(ShowOne, HelperBase):
     """Helper class for ShowOne"""
@@ -263,10 +882,20 @@ class ShowOneHelper(ShowOne, HelperBase):
         ShowOne.__init__(self, app, app_args, cmd_name)
         HelperBase.__init__(self)
 
+    def _load_formatter_plugins(self):
+        return load_formatter_plugins(self, super(ShowOneHelper, self)._load_formatter_plugins)
+
     def get_parser(self, prog_name):
+        return self.get_cached_parser(prog_name, self.build_parser)
+
+    def build_parser(self, prog_name):
         parser = super(ShowOneHelper, self).get_parser(prog_name)
         return self.get_parser_with_arguments(parser)
 
+    def produce_output(self, parsed_args, column_names, data):
+        with timing.span('format'):
+            return super(ShowOneHelper, self).produce_output(parsed_args, column_names, data)
+
     def take_action(self, parsed_args):
         try:
             result = self.send_receive(self.app, parsed_args)
@@ -274,10 +903,9 @@ class ShowOneHelper(ShowOne, HelperBase):
             sorted_keys = self.get_sorted_keys(parsed_args, result[DATA])
             if self.message:
                 self.app.stdout.write(self.message + '\n')
+            project = self.get_row_projector(parsed_args)
             for k in sorted_keys:
-                data = [HelperBase.convert_utc_to_timezone(result[DATA][k][i])
-                        if not getattr(parsed_args, UTC, False) and i == TIME
-                        else result[DATA][k][i] for i in self.columns]
+                data = project(result[DATA][k])
                 if k != sorted_keys[-1]:
                     self.formatter.emit_one(header, data, self.app.stdout, parsed_args)
                     self.app.stdout.write('\n')
@@ -294,6 +922,9 @@ class CommandHelper(Command, HelperBase):
         HelperBase.__init__(self)
 
     def get_parser(self, prog_name):
+        return self.get_cached_parser(prog_name, self.build_parser)
+
+    def build_parser(self, prog_name):
         parser = super(CommandHelper, self).get_parser(prog_name)
         return self.get_parser_with_arguments(parser)
 
@@ -0,0 +1,160 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" History-driven prefetching of read-only requests in the interactive mode
+    The first GET request of every command whose helper declares a cache TTL is recorded,
+    together with the request of the command before it. After a command, the requests which most often followed it are sent
+    in the background, so the next command may be answered from memory.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from hostcli import responsecache
+from hostcli import storage
+
+LOG = logging.getLogger(__name__)
+
+PREFETCH_COUNT = 3      # requests prefetched after a command
+MIN_OCCURRENCES = 2     # times a request must have followed the command to be prefetched
+PREFETCH_TTL = 60       # seconds a prefetched response may be used
+MAX_HISTORY = 200       # requests kept in the history
+WAIT_TIMEOUT = 10       # seconds a command waits for a prefetch of the same request in flight
+
+COUNTS = 'counts'
+NEXT = 'next'
+REQUESTS = 'requests'
+
+_local = threading.local()
+
+
+def request_id(url, params):
+    return json.dumps([url, sorted((params or {}).items())])
+
+
+class Prefetcher(object):
+    """Records the GET requests of the commands and prefetches the likely next ones"""
+    def __init__(self, path=None, ttl=PREFETCH_TTL, count=PREFETCH_COUNT):
+        directory = storage.private_dir('history')
+        self.path = path or (os.path.join(directory, 'requests.json') if directory else None)
+        self.ttl = ttl
+        self.count = count
+        self.history = (storage.read_json(self.path) if self.path else None) or {COUNTS: {}, NEXT: {}, REQUESTS: {}}
+        self.lock = threading.Lock()
+        self.responses = {}     # key: record of the prefetched response
+        self.pending = {}       # key: event set when the prefetch is done
+        self.previous = None    # request of the previous command
+        self.current = None     # first request of the running command
+        self.req = None
+        self.hits = 0
+
+    @staticmethod
+    def prefetching():
+        return getattr(_local, 'prefetching', False)
+
+    def take(self, key, ttl=None):
+        """ Returns the record of the prefetched response and forgets it, waiting for a prefetch in flight
+            The response is used if it is younger than ttl seconds, at most the TTL of the prefetcher.
+        """
+        with self.lock:
+            event = self.pending.get(key)
+        if event:
+            event.wait(WAIT_TIMEOUT)
+        with self.lock:
+            record = self.responses.pop(key, None)
+        if record and time.time() - record[responsecache.STORED] < min(self.ttl, ttl or self.ttl):
+            self.hits += 1
+            return record
+        return None
+
+    def clear(self):
+        """Forget the prefetched responses, e.g. because something was changed"""
+        with self.lock:
+            self.responses.clear()
+
+    def observe(self, req, url, params):
+        """Called with every GET request of the commands"""
+        if self.current is None:
+            self.req = req
+            self.current = (url, params)
+
+    def command_done(self):
+        """Update the history with the request of the command and prefetch the likely next requests"""
+        if self.current is None:
+            return
+        rid = request_id(*self.current)
+        with self.lock:
+            counts = self.history[COUNTS]
+            counts[rid] = counts.get(rid, 0) + 1
+            self.history[REQUESTS][rid] = list(self.current)
+            if self.previous:
+                following = self.history[NEXT].setdefault(self.previous, {})
+                following[rid] = following.get(rid, 0) + 1
+            self._trim()
+        self.previous = rid
+        self.current = None
+        if self.path:
+            storage.write_json(self.path, self.history)
+        self.start(requests=self.likely(self.history[NEXT].get(rid, {})))
+
+    def start(self, req=None, requests=None):
+        """Prefetch the requests in the background with req, by default the most frequent ones"""
+        req = req or self.req
+        if requests is None:
+            requests = self.likely(self.history[COUNTS])
+        if not requests or req is None:
+            return
+        thread = threading.Thread(target=self._fetch, args=(req, requests))
+        thread.daemon = True
+        thread.start()
+
+    def likely(self, counts):
+        rids = sorted((rid for rid, n in counts.items() if n >= MIN_OCCURRENCES), key=lambda r: -counts[r])
+        return [self.history[REQUESTS][rid] for rid in rids[:self.count] if rid in self.history[REQUESTS]]
+
+    def _trim(self):
+        counts = self.history[COUNTS]
+        if len(counts) <= MAX_HISTORY:
+            return
+        kept = set(sorted(counts, key=lambda r: -counts[r])[:MAX_HISTORY])
+        for name in (COUNTS, REQUESTS, NEXT):
+            self.history[name] = dict((k, v) for k, v in self.history[name].items() if k in kept)
+        for following in self.history[NEXT].values():
+            for rid in [r for r in following if r not in kept]:
+                del following[rid]
+
+    def _fetch(self, req, requests):
+        _local.prefetching = True
+        for url, params in requests:
+            key = responsecache.make_key(url, params, req.identity())
+            event = threading.Event()
+            with self.lock:
+                if key in self.pending or key in self.responses:
+                    continue
+                self.pending[key] = event
+            try:
+                response = req._operation('get', url, params=params, decode_json=False, decoded=True)
+                if response.ok:
+                    with self.lock:
+                        self.responses[key] = responsecache.to_record(response)
+            except Exception as exp:
+                LOG.debug('Prefetching %s failed: %s', url, exp)
+            finally:
+                with self.lock:
+                    del self.pending[key]
+                event.set()
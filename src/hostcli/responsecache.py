@@ -0,0 +1,146 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import base64
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from hostcli import storage
+
+LOG = logging.getLogger(__name__)
+
+MAX_SIZE = 64 * 1024 * 1024     # bytes
+EVICT_TO = 0.9                  # part of max_size left after an eviction, so it does not run on every store
+
+STORED = 'stored'
+TOTAL = '.total'    # file holding the total size of the entries
+
+
+def to_record(response):
+    """Serializable form of a response, the body is read if it was streamed"""
+    return {'url': response.url,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict(response.headers),
+            'body': base64.b64encode(response.content).decode('ascii'),
+            STORED: time.time()}
+
+
+def from_record(record):
+    response = requests.Response()
+    response.url = record['url']
+    response.status_code = record['status']
+    response.reason = record['reason']
+    response.headers = CaseInsensitiveDict(record['headers'])
+    response._content = base64.b64decode(record['body'])
+    response._content_consumed = True
+    return response
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def make_key(url, params, identity):
+    content = json.dumps([url, sorted((params or {}).items()), identity])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(object):
+    """ On-disk cache of GET responses, private to the user
+        The least recently used entries are evicted when the total size exceeds max_size. The
+        total is kept up to date in a file, so the entries are listed only to evict some.
+    """
+    def __init__(self, path=None, max_size=MAX_SIZE):
+        self.path = path or storage.private_dir('responses')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def load(self, key):
+        if not self.path:
+            return None
+        path = os.path.join(self.path, key)
+        record = storage.read_json(path)
+        if record:
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return record
+
+    def store(self, key, record):
+        if not self.path:
+            return
+        path = os.path.join(self.path, key)
+        old = _size(path)
+        storage.write_json(path, record)
+        self.account(_size(path) - old)
+
+    def account(self, delta):
+        """Add delta bytes to the total size of the entries, evicting entries once it exceeds max_size"""
+        try:
+            f = os.fdopen(os.open(os.path.join(self.path, TOTAL), os.O_RDWR | os.O_CREAT, 0o600), 'r+')
+        except (IOError, OSError) as exp:
+            LOG.debug('Cannot open the total size of the response cache: %s', exp)
+            return
+        with f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                total = int(f.read()) + delta
+            except ValueError:
+                # not known yet
+                total = None
+            if total is None or total > self.max_size or total < 0:
+                total = self.evict()
+            f.seek(0)
+            f.truncate()
+            f.write(str(total))
+
+    def evict(self):
+        """Evict the least recently used entries if the total size exceeds max_size, returns the new total"""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(e[1] for e in entries)
+        if total <= self.max_size:
+            return total
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size * EVICT_TO:
+                break
+            LOG.debug('Evicting cached response %s', name)
+            storage.remove(os.path.join(self.path, name))
+            total -= size
+        return total
+
+    def stats(self):
+        return 'response cache: %d hits, %d misses, %d revalidated' % (self.hits, self.misses, self.revalidated)
@@ -13,16 +13,123 @@
 # limitations under the License.
 #
 
+import json
 import logging
-import requests
 import os
+import threading
+import time
+import zlib
+from multiprocessing.pool import ThreadPool
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+try:
+    # every content encoding the installed urllib3 is able to decode
+    from requests.packages.urllib3.util.request import ACCEPT_ENCODING
+except ImportError:
+    ACCEPT_ENCODING = None
+
+from hostcli import decoder
+from hostcli import responsecache
+from hostcli import retry
+from hostcli import timing
+from hostcli import tokenmanager
 
 API_NAME = 'resthandler'
 LOG = logging.getLogger(__name__)
 
+POOL_SIZE = 10
+POOL_RETRIES = 3
+MAX_IN_FLIGHT = 8
+IDEMPOTENT = ('get', 'put', 'delete')
+MSGPACK = 'msgpack'
+JSON = 'json'
+WIRE_FORMATS = (MSGPACK, JSON)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+RETRY_STATUS = (502, 503, 504)
+
+# Settings of the HTTP session shared by every RestRequest in the process
+_settings = {'pool_size': POOL_SIZE,
+             'keepalive': True,
+             'retries': POOL_RETRIES,
+             'max_in_flight': MAX_IN_FLIGHT,
+             'retry_policy': retry.RetryPolicy(),
+             'response_cache': None,
+             'prefetcher': None,
+             'coalescer': None,
+             'wire_format': MSGPACK}
+POOL_SETTINGS = ('pool_size', 'keepalive', 'retries')
+_session = None
+_session_lock = threading.Lock()
+
+
 def make_instance(instance):
     return RestRequest(instance)
 
+
+def configure(**settings):
+    """Update the settings, the session is rebuilt on next use if the pool settings changed"""
+    global _session
+    with _session_lock:
+        changed = any(k in POOL_SETTINGS and _settings[k] != v for k, v in settings.items())
+        _settings.update(settings)
+        if changed and _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session():
+    """Return the process wide keep-alive session, creating it if needed"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def get_coalescer():
+    return _settings['coalescer']
+
+
+def get_response_cache():
+    return _settings['response_cache']
+
+
+def iter_body(data, compress):
+    """Yield the body read from a file object or an iterable piece by piece, gzip compressed if requested"""
+    chunks = data
+    if hasattr(data, 'read'):
+        chunks = iter(lambda: data.read(UPLOAD_CHUNK_SIZE), data.read(0))
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def _build_session():
+    LOG.debug("Creating HTTP session with settings %s" % _settings)
+    session = requests.Session()
+    # Only connection errors are retried, a request which reached the server is never resent
+    retry = Retry(total=_settings['retries'], read=False, backoff_factor=0.1)
+    adapter = HTTPAdapter(pool_maxsize=_settings['pool_size'], max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not _settings['keepalive']:
+        session.headers['Connection'] = 'close'
+    return session
+
+
 class RestRequest(object):
     """ RestRequest object
         This module can be used in the context of hostcli rest implementations.
@@ -49,36 +156,84 @@ class RestRequest(object):
     """
     def __init__(self, app_instance):
         self.instance = app_instance
+        self.tokens = None
         if self.instance._auth_required:
-            self.token = self.instance.auth_ref.auth_token
-            self.auth_ref = self.instance.auth_ref
-            self.url = self.auth_ref.service_catalog.url_for(service_type="restfulapi",
-                                                             service_name="restfulframework",
-                                                             interface=self.instance.interface)
+            self.tokens = tokenmanager.get_manager(self.instance)
+            self.url = self.instance.get_endpoint_for_service(service_type="restfulapi",
+                                                              service_name="restfulframework",
+                                                              interface=self.instance.interface)
         else:
             if 'OS_REST_URL' in os.environ:
                 self.url = os.environ['OS_REST_URL']
             else:
                 raise Exception("OS_REST_URL environment variable missing")
+        self.breakers = {}
+
+    def breaker(self, url):
+        """Returns the circuit breaker of the resource, a failing backend module does not block the others"""
+        path = urlparse(url).path
+        base = urlparse(self.url).path.rstrip('/')
+        if path.startswith(base + '/'):
+            path = path[len(base) + 1:]
+        breaker = self.breakers.get(path)
+        if breaker is None:
+            breaker = self.breakers[path] = _settings['retry_policy'].breaker('%s %s' % (self.url, path))
+        return breaker
+
+    @property
+    def token(self):
+        return self.tokens.token if self.tokens else None
+
+    @property
+    def auth_ref(self):
+        return self.tokens.auth_ref if self.tokens else None
 
     def get(self, url, data=None, params=None, decode_json=True):
         return self._operation("get", url, data=data, params=params, decode_json=decode_json)
 
-    def post(self, url, data=None, params=None, decode_json=True):
-        return self._operation("post", url, data=data, params=params, decode_json=decode_json)
+    def post(self, url, data=None, params=None, decode_json=True, compress=False):
+        return self._operation("post", url, data=data, params=params, decode_json=decode_json, compress=compress)
 
-    def put(self, url, data=None, params=None, decode_json=True):
-        return self._operation("put", url, data=data, params=params, decode_json=decode_json)
+    def put(self, url, data=None, params=None, decode_json=True, compress=False):
+        return self._operation("put", url, data=data, params=params, decode_json=decode_json, compress=compress)
 
-    def patch(self, url, data=None, params=None, decode_json=True):
-        return self._operation("patch", url, data=data, params=params, decode_json=decode_json)
+    def patch(self, url, data=None, params=None, decode_json=True, compress=False):
+        return self._operation("patch", url, data=data, params=params, decode_json=decode_json, compress=compress)
 
     def delete(self, url, data=None, params=None, decode_json=True):
         return self._operation("delete", url, data=data, params=params, decode_json=decode_json)
 
-    def _operation(self, oper, url, data=None, params=None, decode_json=True):
+    def operations(self, calls, decode_json=True, cache_ttl=None, decoded=False):
+        """ Run several operations concurrently with a bounded number of requests in flight
+            calls is a list of (operation, url, data, params) tuples. The returned list holds
+            a (result, error) tuple for every call in the same order, error is None on success.
+        """
+        def run(call):
+            try:
+                return self._operation(*call, decode_json=decode_json, cache_ttl=cache_ttl, decoded=decoded), None
+            except Exception as exp:
+                return None, exp
+
+        if len(calls) < 2:
+            return [run(call) for call in calls]
+        pool = ThreadPool(min(len(calls), _settings['max_in_flight']))
+        try:
+            return pool.map(run, calls)
+        finally:
+            pool.close()
+
+    def identity(self):
+        auth_ref = self.auth_ref
+        return [auth_ref.user_id, auth_ref.project_id] if auth_ref else None
+
+    def _operation(self, oper, url, data=None, params=None, decode_json=True, stream=False, cache_ttl=None,
+                   compress=False, decoded=False):
+        """ Send the request and return the decoded body, or the response if decode_json is False
+            decoded tells that the caller decodes the body of the response with the decoder module,
+            so it may be in any of the encodings the decoder reads.
+        """
 
-        operation = getattr(requests, oper, None)
+        operation = getattr(get_session(), oper, None)
 
         if not operation:
             raise NameError("Operation %s not found" % oper)
@@ -91,41 +246,130 @@ class RestRequest(object):
         # Disable request debug logs
         logging.getLogger("requests").setLevel(logging.WARNING)
 
-        # HACK:Check if the authentication will expire and if so then renew it
-        if self.instance._auth_required and self.auth_ref.will_expire_soon():
-            LOG.debug("Session will expire soon... Renewing token")
-            self.instance._auth_setup_completed = False
-            self.instance._auth_ref = None
-            self.token = self.instance.auth_ref.auth_token
-        else:
-            LOG.debug("Session is solid. Using existing token.")
+        # Read-only requests of the interactive mode may have been prefetched, only those of
+        # the helpers declaring a TTL are, and the response is used for at most that long
+        prefetcher = _settings['prefetcher']
+        if prefetcher and not prefetcher.prefetching():
+            if oper == 'get' and not data and cache_ttl:
+                prefetcher.observe(self, url, params)
+                record = prefetcher.take(responsecache.make_key(url, params, self.identity()), cache_ttl)
+                if record:
+                    LOG.debug("Using prefetched response")
+                    return self._result(responsecache.from_record(record), decode_json)
+            elif oper != 'get':
+                prefetcher.clear()
+
+        # The token is normally renewed in the background before it expires
+        token = self.tokens.get_token() if self.tokens else None
 
         # Add security headers
         arguments = {}
         headers = {'User-Agent': 'HostCli'}
 
-        if self.instance._auth_required:
-            headers.update({'X-Auth-Token': self.token})
+        if token:
+            headers.update({'X-Auth-Token': token})
 
+        # Ask for the compact encoding when the response is decoded according to its Content-Type,
+        # the callers of the raw response may expect JSON
+        if _settings['wire_format'] == MSGPACK and (decode_json or decoded):
+            headers['Accept'] = decoder.accept()
+        if ACCEPT_ENCODING:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+        # File objects and iterables are sent piece by piece and cannot be resent
+        replayable = True
         if data:
             if isinstance(data, dict):
-                arguments["json"] = data
                 headers["Content-Type"] = "application/json"
-            else:
-                arguments["data"] = data
+                if compress:
+                    arguments["data"] = b''.join(iter_body([json.dumps(data)], True))
+                else:
+                    arguments["json"] = data
+            elif isinstance(data, (bytes, type(u''))):
                 headers["Content-Type"] = "text/plain"
+                arguments["data"] = b''.join(iter_body([data], True)) if compress else data
+            else:
+                replayable = False
+                headers["Content-Type"] = "application/octet-stream"
+                # a plain file is sent with its length, the rest with chunked transfer encoding
+                arguments["data"] = data if hasattr(data, 'read') and not compress else iter_body(data, compress)
+            if compress:
+                headers["Content-Encoding"] = "gzip"
 
         arguments["headers"] = headers
 
         if params:
             arguments["params"] = params
 
-        ret = operation(url, **arguments)
+        if stream:
+            arguments["stream"] = True
+
+        # Read-only requests of helpers declaring a TTL are served from the response cache
+        cache = _settings['response_cache'] if oper == 'get' and cache_ttl else None
+        record = None
+        if cache:
+            key = responsecache.make_key(url, params, [self.identity(), headers.get('Accept')])
+            record = cache.load(key)
+            if record and time.time() - record[responsecache.STORED] < cache_ttl:
+                LOG.debug("Using cached response")
+                cache.hits += 1
+                return self._result(responsecache.from_record(record), decode_json)
+            if record and 'ETag' in record['headers']:
+                headers['If-None-Match'] = record['headers']['ETag']
+            elif record and 'Last-Modified' in record['headers']:
+                headers['If-Modified-Since'] = record['headers']['Last-Modified']
+
+        def send():
+            return operation(url, **arguments)
+
+        def fetch():
+            # Requests which may have changed something are not resent
+            ret = _settings['retry_policy'].call(send,
+                                                 (requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+                                                 self.breaker(url),
+                                                 lambda r: r.status_code in RETRY_STATUS,
+                                                 None if oper in IDEMPOTENT and replayable else 1)
+
+            if ret.status_code == 401 and token and replayable:
+                LOG.debug("Token was rejected... Renewing token and retrying")
+                headers['X-Auth-Token'] = self.tokens.refresh(token)
+                ret = send()
+            return ret
+
+        # Identical GET requests in flight in other processes share one response
+        coalescer = _settings['coalescer'] if oper == 'get' and not data else None
+        with timing.span('http'):
+            if coalescer:
+                ret = coalescer.run(responsecache.make_key(url, params, [self.identity(),
+                                                                        headers.get('Accept'),
+                                                                        headers.get('If-None-Match'),
+                                                                        headers.get('If-Modified-Since')]),
+                                    fetch,
+                                    stream)
+            else:
+                ret = fetch()
+
+        if cache and record and ret.status_code == 304:
+            LOG.debug("Cached response is still valid")
+            cache.revalidated += 1
+            record[responsecache.STORED] = time.time()
+            cache.store(key, record)
+            ret = responsecache.from_record(record)
+        elif cache:
+            cache.misses += 1
+            # a streamed body is left to the caller, it may be too large to be held in memory
+            if ret.ok and not stream:
+                cache.store(key, responsecache.to_record(ret))
+
+        return self._result(ret, decode_json)
 
+    @staticmethod
+    def _result(ret, decode_json):
         if decode_json:
             ret.raise_for_status()
             try:
-                return ret.json()
+                with timing.span('decode'):
+                    return decoder.decode(ret)
             except ValueError:
                 return {}
         else:
@@ -0,0 +1,186 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+
+from hostcli import storage
+
+LOG = logging.getLogger(__name__)
+
+ATTEMPTS = 30
+DEADLINE = 60           # seconds
+BASE_DELAY = 0.5        # seconds
+MAX_DELAY = 8           # seconds
+FAILURE_THRESHOLD = 5   # consecutive failures opening the circuit
+RESET_TIMEOUT = 30      # seconds before an open circuit lets a trial request through
+
+FAILURES = 'failures'
+OPENED = 'opened'
+
+
+class CircuitOpen(Exception):
+    def __init__(self, key, retry_at):
+        super(CircuitOpen, self).__init__('%s is unavailable, too many consecutive failures' % key)
+        self.retry_at = retry_at
+
+
+class CircuitBreaker(object):
+    """ Circuit breaker of one endpoint
+        The state is kept in a file shared by all the processes of the user. After threshold
+        consecutive failures the circuit opens and the calls fail immediately. Once reset_timeout
+        has passed, a single caller is let through, and its result closes or reopens the circuit.
+    """
+    def __init__(self, key, threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.key = key
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = {FAILURES: 0, OPENED: None}
+        directory = storage.private_dir('circuits')
+        self.path = os.path.join(directory, hashlib.sha1(key.encode('utf-8')).hexdigest()) if directory else None
+
+    def _read(self):
+        """Returns the state under a shared lock, the file is not created"""
+        if not self.path:
+            return self.state
+        try:
+            f = open(self.path)
+        except (IOError, OSError):
+            return {FAILURES: 0, OPENED: None}
+        with f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                state = {}
+        state.setdefault(FAILURES, 0)
+        state.setdefault(OPENED, None)
+        return state
+
+    def _update(self, func):
+        """Apply func on the state while holding the lock of the state file, it is written only if changed"""
+        if not self.path:
+            return func(self.state)
+        with os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                state = {}
+            state.setdefault(FAILURES, 0)
+            state.setdefault(OPENED, None)
+            before = dict(state)
+            result = func(state)
+            if state != before:
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+            return result
+
+    def allow(self):
+        def check(state):
+            if state[OPENED] is None:
+                return None
+            now = time.time()
+            if now < state[OPENED] + self.reset_timeout:
+                return state[OPENED] + self.reset_timeout
+            # half open, this caller makes the trial request
+            state[OPENED] = now
+            return None
+        state = self._read()
+        if state[OPENED] is None:
+            # closed, the usual case needs no exclusive lock
+            return
+        retry_at = self._update(check)
+        if retry_at:
+            raise CircuitOpen(self.key, retry_at)
+
+    def success(self):
+        def close(state):
+            state[FAILURES] = 0
+            state[OPENED] = None
+        state = self._read()
+        if state[FAILURES] or state[OPENED] is not None:
+            self._update(close)
+
+    def failure(self):
+        def count(state):
+            state[FAILURES] += 1
+            if state[FAILURES] >= self.threshold:
+                state[OPENED] = time.time()
+        self._update(count)
+
+
+class RetryPolicy(object):
+    """Retries with exponential backoff and full jitter, bounded by an attempt count and a total deadline"""
+    def __init__(self, attempts=ATTEMPTS, deadline=DEADLINE, base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.attempts = attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def breaker(self, key):
+        return CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def call(self, func, retriable=(), breaker=None, retry_result=None, attempts=None):
+        """ Call func until it neither raises one of the retriable exceptions nor returns a result
+            for which retry_result is true. When the attempts or the deadline run out, the last
+            exception is raised or the last result is returned.
+        """
+        attempts = attempts or self.attempts
+        deadline = time.time() + self.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            error = None
+            result = None
+            try:
+                if breaker:
+                    breaker.allow()
+                result = func()
+            except CircuitOpen as exp:
+                delay = exp.retry_at - time.time() + self.delay(1)
+                if attempt >= attempts or time.time() + delay > deadline:
+                    raise
+                LOG.debug('%s, retrying in %.1f seconds', exp, delay)
+                time.sleep(delay)
+                continue
+            except retriable as exp:
+                error = exp
+            if error is None and (retry_result is None or not retry_result(result)):
+                if breaker:
+                    breaker.success()
+                return result
+            if breaker:
+                breaker.failure()
+            delay = self.delay(attempt)
+            if attempt >= attempts or time.time() + delay > deadline:
+                if error is not None:
+                    raise error
+                return result
+            LOG.debug('Attempt %d failed (%s), retrying in %.1f seconds',
+                      attempt, error or result, delay)
+            time.sleep(delay)
@@ -0,0 +1,68 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import errno
+import json
+import logging
+import os
+import stat
+import tempfile
+
+LOG = logging.getLogger(__name__)
+
+
+def private_dir(name):
+    """Return a directory under the user's cache directory which is accessible only by the user.
+       None is returned if the directory cannot be created or its permissions are too open."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'hostcli', name)
+    try:
+        os.makedirs(path, 0o700)
+    except OSError as exp:
+        if exp.errno != errno.EEXIST:
+            LOG.debug('Cannot create %s: %s', path, exp)
+            return None
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        LOG.warning('Not using %s, it must be owned by the user and have 0700 permissions', path)
+        return None
+    return path
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_json(path, content):
+    """Atomically replace path with the JSON dump of content, the file is created with 0600 permissions"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f)
+        os.rename(tmp, path)
+    except (IOError, OSError, TypeError, ValueError) as exp:
+        LOG.debug('Cannot write %s: %s', path, exp)
+        remove(tmp)
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
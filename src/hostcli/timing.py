@@ -0,0 +1,81 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Named timing spans of the phases of a hostcli run
+    The spans are summed per phase as they are recorded, so a long run, e.g. of --watch,
+    does not accumulate them. The module only depends on the standard library.
+"""
+
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+
+_phases = {}    # name: [name, count, total seconds, start of the first span]
+_lock = threading.Lock()
+
+
+def record(name, start, duration):
+    with _lock:
+        phase = _phases.get(name)
+        if phase is None:
+            _phases[name] = [name, 1, duration, start]
+        else:
+            phase[1] += 1
+            phase[2] += duration
+            phase[3] = min(phase[3], start)
+
+
+@contextlib.contextmanager
+def span(name):
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(name, start, time.time() - start)
+
+
+def reset():
+    with _lock:
+        _phases.clear()
+
+
+def phases():
+    """Returns the [name, count, total seconds] of every phase, in the order of their first span"""
+    with _lock:
+        phases = sorted(_phases.values(), key=lambda p: p[3])
+    return [p[:3] for p in phases]
+
+
+def report():
+    lines = ['%-10s %6s %10s' % ('phase', 'count', 'ms')]
+    for name, count, total in phases():
+        lines.append('%-10s %6d %10.1f' % (name, count, total * 1000))
+    return '\n'.join(lines) + '\n'
+
+
+def append_record(path, command, exit_code):
+    """Append the phases of the run of the named command to path as one JSON line, the file is private to the user"""
+    content = {'time': time.time(),
+               'host': socket.gethostname(),
+               'pid': os.getpid(),
+               'command': command,
+               'exit_code': exit_code,
+               'phases': dict((name, {'count': count, 'ms': round(total * 1000, 3)})
+                              for name, count, total in phases())}
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600), 'a') as f:
+        f.write(json.dumps(content) + '\n')
@@ -0,0 +1,139 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import os
+
+from osc_lib import clientmanager
+
+from hostcli import storage
+from hostcli import timing
+
+LOG = logging.getLogger(__name__)
+
+AUTH_STATE = 'auth_state'
+ENDPOINTS = 'endpoints'
+
+
+class TokenCache(object):
+    """ Per-user, file backed cache of keystone tokens
+        Every entry is stored in its own file named after the cache id of the auth plugin,
+        which is derived from the auth url, the project, the user and the credentials.
+        An entry holds the serialized auth state (token, expiry and service catalog) and
+        the endpoints resolved from the catalog.
+    """
+    def __init__(self, path=None):
+        self.path = path or storage.private_dir('tokens')
+
+    def _file(self, cache_id):
+        return os.path.join(self.path, cache_id) if self.path else None
+
+    def load(self, cache_id):
+        path = self._file(cache_id)
+        return storage.read_json(path) if path else None
+
+    def store(self, cache_id, entry):
+        path = self._file(cache_id)
+        if path:
+            storage.write_json(path, entry)
+
+    def remove(self, cache_id):
+        path = self._file(cache_id)
+        if path:
+            storage.remove(path)
+
+
+class ClientManager(clientmanager.ClientManager):
+    """ClientManager which takes the keystone token and the endpoints from a TokenCache when possible"""
+    def __init__(self, token_cache=None, **kwargs):
+        super(ClientManager, self).__init__(**kwargs)
+        self.token_cache = token_cache
+        self._cache_id = None
+        self._cache_entry = None
+
+    def set_cli_options(self, cli_options):
+        """Use the options of a cloud, with the settings ClientManager.__init__ copies from them"""
+        self._cli_options = cli_options
+        self.region_name = cli_options.region_name
+        self.interface = cli_options.interface
+        self.timing = cli_options.timing
+        self.verify, self.cert = cli_options.get_requests_verify_args()
+        self.cacert = None if isinstance(self.verify, bool) else self.verify
+        cli_options.config['api_timeout'] = None
+
+    @property
+    def auth_ref(self):
+        if self._auth_ref:
+            return self._auth_ref
+        with timing.span('auth'):
+            if self.token_cache and self._auth_required and self._cli_options.config['auth_type'] != 'none':
+                self.setup_auth()
+                self._auth_ref = self._load_auth_ref()
+                if not self._auth_ref:
+                    self._auth_ref = self.auth.get_auth_ref(self.session)
+                    self._store_auth_ref()
+            return super(ClientManager, self).auth_ref
+
+    def reauthenticate(self):
+        """Drop the current token, also from the token cache, and authenticate again"""
+        if self.token_cache and self._cache_id:
+            self.token_cache.remove(self._cache_id)
+        self._auth_setup_completed = False
+        self._auth_ref = None
+        return self.auth_ref
+
+    def get_endpoint_for_service(self, service_type, service_name, interface):
+        key = '%s/%s/%s' % (service_type, service_name, interface)
+        if self._cache_entry and key in self._cache_entry[ENDPOINTS]:
+            return self._cache_entry[ENDPOINTS][key]
+        auth_ref = self.auth_ref
+        with timing.span('catalog'):
+            url = auth_ref.service_catalog.url_for(service_type=service_type,
+                                                   service_name=service_name,
+                                                   interface=interface)
+        if self._cache_entry:
+            self._cache_entry[ENDPOINTS][key] = url
+            self.token_cache.store(self._cache_id, self._cache_entry)
+        return url
+
+    def _load_auth_ref(self):
+        try:
+            self._cache_id = self.auth.get_cache_id()
+        except (AttributeError, NotImplementedError):
+            self._cache_id = None
+        if not self._cache_id:
+            return None
+        entry = self.token_cache.load(self._cache_id)
+        if not entry:
+            return None
+        try:
+            self.auth.set_auth_state(entry[AUTH_STATE])
+        except (KeyError, TypeError, ValueError) as exp:
+            LOG.debug('Dropping unusable cached token: %s', exp)
+            self.token_cache.remove(self._cache_id)
+            return None
+        if not self.auth.auth_ref or self.auth.auth_ref.will_expire_soon():
+            LOG.debug('Cached token will expire soon')
+            self.token_cache.remove(self._cache_id)
+            return None
+        LOG.debug('Using cached token')
+        self._cache_entry = entry
+        return self.auth.auth_ref
+
+    def _store_auth_ref(self):
+        if not self._cache_id:
+            return
+        self._cache_entry = {AUTH_STATE: self.auth.get_auth_state(), ENDPOINTS: {}}
+        self.token_cache.store(self._cache_id, self._cache_entry)
@@ -0,0 +1,112 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import datetime
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+
+REFRESH_MARGIN = 120    # seconds before the expiry when the token is renewed in the background
+
+# the TokenManagers of the process, by the cache id of their credentials
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def _key(instance):
+    try:
+        instance.setup_auth()
+        return instance.auth.get_cache_id() or id(instance)
+    except (AttributeError, NotImplementedError):
+        return id(instance)
+
+
+def get_manager(instance):
+    """Returns the TokenManager of the credentials of instance, one per credentials in the process"""
+    key = _key(instance)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = TokenManager(instance)
+        return manager
+
+
+def cancel_all():
+    """Stop the background renewals, e.g. when the app exits"""
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.cancel()
+        _managers.clear()
+
+
+class TokenManager(object):
+    """ Keeps a valid keystone token of a ClientManager
+        A background timer renews the token before it expires, so the requests do not wait
+        for keystone. Only one renewal is in flight at a time, the callers needing a new
+        token meanwhile wait for it and get its result instead of authenticating again.
+    """
+    def __init__(self, instance, margin=REFRESH_MARGIN):
+        self.instance = instance
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.timer = None
+        self.auth_ref = instance.auth_ref
+        self._schedule()
+
+    @property
+    def token(self):
+        return self.auth_ref.auth_token
+
+    def get_token(self):
+        auth_ref = self.auth_ref
+        if auth_ref.will_expire_soon():
+            LOG.debug("Session will expire soon... Renewing token")
+            return self.refresh(auth_ref.auth_token)
+        return auth_ref.auth_token
+
+    def refresh(self, stale_token=None):
+        """Renew the token, unless it was already replaced since stale_token was handed out"""
+        with self.lock:
+            if stale_token is not None and stale_token != self.auth_ref.auth_token:
+                return self.auth_ref.auth_token
+            self.auth_ref = self.instance.reauthenticate()
+            self._schedule()
+            return self.auth_ref.auth_token
+
+    def cancel(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def _schedule(self):
+        self.cancel()
+        expires = self.auth_ref.expires
+        if not expires:
+            return
+        delay = (expires - datetime.datetime.now(expires.tzinfo)).total_seconds() - self.margin
+        if delay <= 0:
+            return
+        LOG.debug("Renewing token in %d seconds", delay)
+        self.timer = threading.Timer(delay, self._background_refresh, [self.auth_ref.auth_token])
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _background_refresh(self, token):
+        try:
+            self.refresh(token)
+        except Exception as exp:
+            # the next request renews the token when it is about to expire
+            LOG.debug("Background token renewal failed: %s", exp)
@@ -0,0 +1,188 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" The --where expressions filtering the entries of a listing
+    An expression is made of comparisons joined with and, or, not and parentheses, e.g.
+        State = running and (Name ~ "^web" or Restarts >= 3) and Time >= 2019-01-31T10:00
+    The operators are = != < <= > >= ~ (regular expression search) and !~. The expression is
+    compiled once into a predicate function called with the entries of the data.
+"""
+
+import numbers
+import operator
+import re
+
+COMPARISONS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+MATCHES = ('~', '!~')
+KEYWORDS = ('and', 'or', 'not')
+
+TOKEN = re.compile(r'\s*(?:(?P<paren>[()])|'
+                   r'(?P<op><=|>=|!=|!~|==|=|<|>|~)|'
+                   r'"(?P<dquoted>(?:[^"\\]|\\.)*)"|'
+                   r"'(?P<squoted>[^']*)'|"
+                   r'(?P<word>[^\s()=<>!~"\']+))')
+
+
+def tokenize(expression):
+    """Returns the list of (kind, text) tokens, kind is paren, op, word or quoted"""
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        m = TOKEN.match(expression, pos)
+        if not m or m.end() == pos:
+            raise Exception('Invalid where expression at: %s' % expression[pos:])
+        pos = m.end()
+        if m.group('dquoted') is not None:
+            tokens.append(('quoted', re.sub(r'\\(.)', r'\1', m.group('dquoted'))))
+        elif m.group('squoted') is not None:
+            tokens.append(('quoted', m.group('squoted')))
+        else:
+            kind = m.lastgroup
+            tokens.append((kind, m.group(kind)))
+    return tokens
+
+
+def _time_value(value):
+    # the UTC timestamps are compared as text, in the YYYY-MM-DDTHH:MM:SS.fff form
+    value = str(value).replace(' ', 'T').rstrip('Z')
+    if len(value) == 10:
+        value += 'T00:00:00'
+    if len(value) == 19:
+        value += '.000'
+    return value[:23]
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class Parser(object):
+    """ Recursive descent parser building the predicate from closures
+        resolve maps a column name to the key of the entries, convert_time converts the values
+        given for the time_keys to UTC.
+    """
+    def __init__(self, expression, resolve, time_keys=(), convert_time=None):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.pos = 0
+        self.resolve = resolve
+        self.time_keys = time_keys
+        self.convert_time = convert_time
+        self.keys = set()
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise Exception('Unexpected end of where expression: %s' % self.expression)
+        self.pos += 1
+        return token
+
+    def keyword(self, word):
+        kind, text = self.peek()
+        if kind == 'word' and text.lower() == word:
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self):
+        predicate = self.disjunction()
+        if self.pos != len(self.tokens):
+            raise Exception('Unexpected %s in where expression' % self.peek()[1])
+        return predicate
+
+    def disjunction(self):
+        terms = [self.conjunction()]
+        while self.keyword('or'):
+            terms.append(self.conjunction())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda entry: any(t(entry) for t in terms)
+
+    def conjunction(self):
+        terms = [self.negation()]
+        while self.keyword('and'):
+            terms.append(self.negation())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda entry: all(t(entry) for t in terms)
+
+    def negation(self):
+        if self.keyword('not'):
+            term = self.negation()
+            return lambda entry: not term(entry)
+        if self.peek() == ('paren', '('):
+            self.pos += 1
+            term = self.disjunction()
+            if self.next() != ('paren', ')'):
+                raise Exception('Missing ) in where expression')
+            return term
+        return self.comparison()
+
+    def comparison(self):
+        kind, name = self.next()
+        if kind not in ('word', 'quoted') or (kind == 'word' and name.lower() in KEYWORDS):
+            raise Exception('Column name expected instead of %s in where expression' % name)
+        key = self.resolve(name)
+        self.keys.add(key)
+        kind, op = self.next()
+        if kind != 'op':
+            raise Exception('Operator expected after %s in where expression' % name)
+        kind, value = self.next()
+        if kind not in ('word', 'quoted'):
+            raise Exception('Value expected after %s %s in where expression' % (name, op))
+        if op in MATCHES:
+            search = re.compile(value).search
+            if op == '~':
+                return lambda entry: entry.get(key) is not None and search(str(entry[key])) is not None
+            return lambda entry: entry.get(key) is None or search(str(entry[key])) is None
+        compare = COMPARISONS[op]
+        if key in self.time_keys:
+            if self.convert_time:
+                value = self.convert_time(value)
+            value = _time_value(value)
+            return lambda entry: entry.get(key) is not None and compare(_time_value(entry[key]), value)
+        number = _number(value) if kind == 'word' else None
+
+        def test(entry):
+            v = entry.get(key)
+            if v is None:
+                return compare is operator.ne
+            if number is not None and isinstance(v, numbers.Number) and not isinstance(v, bool):
+                return compare(v, number)
+            if isinstance(v, bool):
+                v = str(v).lower()
+            return compare(str(v), value)
+        return test
+
+
+def compile_where(expression, resolve, time_keys=(), convert_time=None):
+    """Returns the predicate of the expression and the set of the keys it reads"""
+    parser = Parser(expression, resolve, time_keys, convert_time)
+    return parser.parse(), parser.keys
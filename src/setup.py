@@ -31,11 +31,17 @@ setup(
     scripts=[],
     provides=[],
     install_requires=['cliff', 'requests', 'keystoneauth1', 'osc_lib'],
+    extras_require={'msgpack': ['msgpack']},
     packages=find_packages(),
     include_package_data=True,
     entry_points={
         'console_scripts': [
-            'hostcli = hostcli.main:main'
+            'hostcli = hostcli.client:main',
+            'hostcli-daemon = hostcli.daemon:main'
+        ],
+        'cliff.formatter.list': [
+            'ndjson = hostcli.formatters:NDJSONFormatter',
+            'stream-table = hostcli.formatters:StreamTableFormatter'
         ],
     },
     zip_safe=False,
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Benchmarks of the hostcli request pipeline against the fake restfulframework server
+    Run from the src directory:
+        python tests/bench.py --output results.json
+        python tests/bench.py --baseline results.json --tolerance 0.25
+    Every metric is saved with its unit and whether lower or higher is better. Given a
+    baseline, the metrics worse than it by more than the tolerance are reported as
+    regressions and the exit code is 1. --quick uses smaller inputs, so its results are
+    comparable only with those of another --quick run.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.dirname(TESTS)
+sys.path.insert(0, SRC)
+
+from hostcli import decoder
+from hostcli import helper
+from hostcli import resthandler
+from hostcli import retry
+from hostcli import timing
+
+import fakeserver
+
+LOWER = 'lower'
+HIGHER = 'higher'
+SORT = ['--sort', 'Severity,Count:desc', '--utc']
+
+
+class Results(object):
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better=LOWER):
+        self.metrics[name] = {'value': round(value, 3), 'unit': unit, 'better': better}
+        print('%-40s %14.3f %s' % (name, value, unit))
+        sys.stdout.flush()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def child_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([SRC] + [p for p in [env.get('PYTHONPATH')] if p])
+    env['HOSTCLI_NO_DAEMON'] = '1'
+    return env
+
+
+def run_process(code, env, runs):
+    """Median wall time in milliseconds of a python process running code"""
+    times = []
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env,
+                              stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+        times.append((time.time() - start) * 1000)
+    return median(times)
+
+
+def bench_cold_start(results, args):
+    """Start-up time of hostcli, run in a new process or forwarded to a daemon (user-003, user-004)"""
+    env = child_env()
+    runs = 3 if args.quick else 7
+    results.add('cold_start.python_ms', run_process('pass', env, runs), 'ms')
+    results.add('cold_start.client_import_ms', run_process('import hostcli.client, hostcli.main', env, runs), 'ms')
+    version = "import sys\nfrom hostcli import client\nsys.exit(client.main(['--version']))"
+    results.add('cold_start.main_ms', run_process(version, env, runs), 'ms')
+    path = os.path.join(args.directory, 'daemon.sock')
+    daemon = subprocess.Popen([sys.executable, '-c', 'from hostcli import daemon; daemon.main(["--socket", "%s"])' % path],
+                              env=env, stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+    try:
+        deadline = time.time() + 60
+        while not os.path.exists(path) and time.time() < deadline:
+            time.sleep(0.05)
+        env = dict(env)
+        env.pop('HOSTCLI_NO_DAEMON')
+        env['HOSTCLI_DAEMON_SOCKET'] = path
+        results.add('cold_start.daemon_ms', run_process(version, env, runs), 'ms')
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def bench_rest(results, args):
+    """Latency and throughput of RestRequest with and without the pooled session (user-001)"""
+    count = 200 if args.quick else 1000
+    with fakeserver.FakeServer() as server:
+        server.add('status', {'state': 'up'})
+        for keepalive in (True, False):
+            resthandler.configure(keepalive=keepalive)
+            req = fakeserver.rest_request(server.url)
+            req.get('status')
+            latencies = []
+            start = time.time()
+            for i in range(count):
+                t = time.time()
+                req.get('status')
+                latencies.append((time.time() - t) * 1000)
+            elapsed = time.time() - start
+            name = 'rest.pooled' if keepalive else 'rest.unpooled'
+            results.add(name + '_req_per_s', count / elapsed, 'req/s', HIGHER)
+            results.add(name + '_p50_ms', percentile(latencies, 0.5), 'ms')
+            results.add(name + '_p99_ms', percentile(latencies, 0.99), 'ms')
+        resthandler.configure(keepalive=True)
+        req = fakeserver.rest_request(server.url)
+        calls = [('get', 'status')] * count
+        start = time.time()
+        req.operations(calls)
+        results.add('rest.concurrent_req_per_s', count / (time.time() - start), 'req/s', HIGHER)
+
+
+def bench_retry(results, args):
+    """Cost of the retry policy and of the circuit breaker of a healthy endpoint (user-008)"""
+    count = 2000 if args.quick else 10000
+    policy = retry.RetryPolicy()
+    breaker = policy.breaker('bench')
+    start = time.time()
+    for i in range(count):
+        policy.call(lambda: None, breaker=breaker)
+    results.add('retry.call_us', (time.time() - start) / count * 1e6, 'us')
+
+
+def bench_wire(results, args):
+    """Payload size and decode time of a listing in JSON and in msgpack (user-017)"""
+    count = 10000 if args.quick else 100000
+    formats = [resthandler.JSON] + ([resthandler.MSGPACK] if decoder.msgpack else [])
+    with fakeserver.FakeServer() as server:
+        server.add('entries', fakeserver.make_entries(count)).encode()
+        req = fakeserver.rest_request(server.url)
+        for wire_format in formats:
+            resthandler.configure(wire_format=wire_format)
+            response = req._operation('get', 'entries', decode_json=False, decoded=True)
+            response.content
+            times = []
+            for i in range(3):
+                start = time.time()
+                decoder.decode(response)
+                times.append((time.time() - start) * 1000)
+            results.add('wire.%s_bytes' % wire_format, len(response.content), 'bytes')
+            results.add('wire.%s_decode_ms' % wire_format, median(times), 'ms')
+        resthandler.configure(wire_format=resthandler.MSGPACK)
+
+
+def peak_rss_mb():
+    # ru_maxrss keeps the peak of the parent across exec on Linux, VmHWM is that of this process
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def stream_child(url, mode):
+    """Run the listing in this process, prints the time to the first row, the total time and the peak RSS"""
+    app = fakeserver.App(url)
+    cmd = fakeserver.EntryList(app, None)
+    parsed_args = cmd.get_parser('entry list').parse_args(['--utc'] if mode == 'streamed' else SORT)
+    start = time.time()
+    header, rows = cmd.take_action(parsed_args)
+    rows = iter(rows)
+    next(rows)
+    first = time.time() - start
+    count = 1 + sum(1 for row in rows)
+    print(json.dumps({'first_row_ms': first * 1000,
+                      'total_ms': (time.time() - start) * 1000,
+                      'rows': count,
+                      'rss_mb': peak_rss_mb()}))
+
+
+def bench_stream(results, args):
+    """Time to the first row and peak memory of a streamed and of a sorted listing (user-009)"""
+    count = 50000 if args.quick else 500000
+    with fakeserver.FakeServer() as server:
+        server.add('entries', fakeserver.make_entries(count)).encode()
+        gc.collect()
+        for mode in ('streamed', 'sorted'):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', server.url, mode],
+                                             env=child_env())
+            child = json.loads(output.decode('utf-8').splitlines()[-1])
+            for name in ('first_row_ms', 'total_ms'):
+                results.add('stream.%s_%s' % (mode, name), child[name], 'ms')
+            results.add('stream.%s_rss_mb' % mode, child['rss_mb'], 'MB')
+
+
+def bench_pipeline(results, args):
+    """send_receive, get_sorted_keys and the row building of a sorted listing of the helper (user-019)"""
+    sizes = [1000, 100000] if args.quick else [1000, 100000, 1000000]
+    with fakeserver.FakeServer() as server:
+        app = fakeserver.App(server.url)
+        for size in sizes:
+            server.add('entries', fakeserver.make_entries(size)).encode()
+            gc.collect()
+            timing.reset()
+            start = time.time()
+            header, rows = fakeserver.run_list(app, SORT)
+            total = time.time() - start
+            phases = dict((name, seconds) for name, count, seconds in timing.phases())
+            name = 'pipeline.%d' % size
+            results.add(name + '_total_ms', total * 1000, 'ms')
+            results.add(name + '_receive_ms', (phases.get('http', 0) + phases.get('decode', 0)) * 1000, 'ms')
+            results.add(name + '_sort_ms', phases.get('sort', 0) * 1000, 'ms')
+            results.add(name + '_per_row_us', total / size * 1e6, 'us')
+            del header, rows
+            server.endpoints.clear()
+            gc.collect()
+
+
+def bench_sort(results, args):
+    """The sort on the plan and the top-k selection of 100k entries (user-011)"""
+    data = fakeserver.make_entries(100000)
+    plan = [('severity', False), ('count', True), ('name', False)]
+    for name, limit in (('sort.100k_ms', None), ('sort.100k_top100_ms', 100)):
+        times = []
+        for i in range(3):
+            start = time.time()
+            helper.HelperBase.sort_keys(list(data), data, plan, limit)
+            times.append((time.time() - start) * 1000)
+        results.add(name, median(times), 'ms')
+    # the former one sort per column, for comparison
+    start = time.time()
+    keys = list(data)
+    for field, descending in reversed(plan):
+        keys.sort(key=lambda k: helper._sort_value(data[k][field]), reverse=descending)
+    results.add('sort.100k_per_column_ms', (time.time() - start) * 1000, 'ms')
+
+
+def bench_time(results, args):
+    """Per row cost of the TIME column conversion (user-013)"""
+    count = 100000 if args.quick else 1000000
+    stamps = ['2019-%02d-%02dT%02d:%02d:%02d.%03dZ' % (i % 12 + 1, i % 28 + 1, i % 24, i % 60, i * 7 % 60, i % 1000)
+              for i in range(count)]
+    convert = helper.LocalTimeConverter()
+    start = time.time()
+    for stamp in stamps:
+        convert(stamp)
+    results.add('time.fast_ns_per_row', (time.time() - start) / count * 1e9, 'ns')
+    start = time.time()
+    for stamp in stamps:
+        convert(stamp)
+    results.add('time.memoized_ns_per_row', (time.time() - start) / count * 1e9, 'ns')
+    generic = stamps[:count // 50]
+    start = time.time()
+    for stamp in generic:
+        helper.HelperBase.convert_utc_to_timezone_generic(stamp)
+    results.add('time.generic_ns_per_row', (time.time() - start) / len(generic) * 1e9, 'ns')
+
+
+BENCHMARKS = [('cold_start', bench_cold_start),
+              ('rest', bench_rest),
+              ('retry', bench_retry),
+              ('wire', bench_wire),
+              ('stream', bench_stream),
+              ('pipeline', bench_pipeline),
+              ('sort', bench_sort),
+              ('time', bench_time)]
+
+
+def compare(metrics, baseline, tolerance):
+    """Print the change of every metric against the baseline, returns the names of the regressions"""
+    regressions = []
+    print('\n%-40s %14s %14s %8s' % ('metric', 'value', 'baseline', 'change'))
+    for name in sorted(metrics):
+        old = baseline.get(name)
+        if not old or not old['value']:
+            continue
+        new = metrics[name]
+        change = new['value'] / old['value'] - 1
+        worse = change if new['better'] == LOWER else -change
+        flag = ''
+        if worse > tolerance:
+            flag = ' REGRESSION'
+            regressions.append(name)
+        print('%-40s %14.3f %14.3f %+7.1f%%%s' % (name, new['value'], old['value'], change * 100, flag))
+    return regressions
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='hostcli benchmarks')
+    parser.add_argument('--only', metavar='NAME[,NAME]',
+                        help='Run only these benchmarks: %s' % ', '.join(n for n, f in BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help='Use smaller inputs')
+    parser.add_argument('--output', metavar='FILE', help='Save the results as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare the results with those saved earlier')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative change of a metric reported as a regression, default 0.25')
+    parser.add_argument('--child', nargs=2, metavar=('URL', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return stream_child(*args.child)
+
+    only = set(args.only.split(',')) if args.only else None
+    args.directory = tempfile.mkdtemp()
+    os.environ['XDG_CACHE_HOME'] = args.directory
+    results = Results()
+    try:
+        for name, bench in BENCHMARKS:
+            if only is None or name in only:
+                bench(results, args)
+    finally:
+        shutil.rmtree(args.directory)
+
+    report = {'meta': {'time': time.time(),
+                       'host': socket.gethostname(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'quick': args.quick,
+                       'msgpack': decoder.msgpack is not None},
+              'results': results.metrics}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('quick') != args.quick:
+            print('The baseline was run with%s --quick, the results are not comparable' %
+                  ('' if baseline['meta'].get('quick') else 'out'))
+            return 2
+        if compare(results.metrics, baseline['results'], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Fake restfulframework server and the synthetic listing command of the tests and benchmarks
+    RestRequest talks to the server through OS_REST_URL, so no keystone is needed. The
+    responses are encoded in JSON, or in msgpack when it is accepted and installed.
+"""
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from hostcli import helper
+from hostcli import resthandler
+from hostcli import retry
+
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+SEVERITIES = ('critical', 'major', 'minor', 'warning', None)
+WRITE_SIZE = 64 * 1024
+
+
+def make_entries(count):
+    """Synthetic listing of count entries with text, number, None and UTC time values"""
+    entries = OrderedDict()
+    for i in range(count):
+        key = 'entry-%07d' % i
+        entries[key] = {'id': key,
+                        'name': 'node-%d' % (i * 7 % 1000),
+                        'severity': SEVERITIES[i % len(SEVERITIES)],
+                        'count': i * 7919 % 1000,
+                        'time': '2019-%02d-%02dT%02d:%02d:%02d.%03dZ' % (i % 12 + 1, i % 28 + 1, i % 24,
+                                                                       i % 60, i * 7 % 60, i % 1000)}
+    return entries
+
+
+class Endpoint(object):
+    """Response of a path, the bodies are encoded once per format"""
+    def __init__(self, data, formats=(JSON, MSGPACK), failures=None):
+        self.data = data
+        self.formats = [f for f in formats if f == JSON or msgpack]
+        self.failures = list(failures or [])   # statuses answered before the data, one per request
+        self.bodies = {}
+        self.lock = threading.Lock()
+
+    def status(self):
+        with self.lock:
+            return self.failures.pop(0) if self.failures else 200
+
+    def body(self, content_type):
+        with self.lock:
+            body = self.bodies.get(content_type)
+            if body is None:
+                content = {'code': 0, 'description': '', 'data': self.data}
+                if content_type == MSGPACK:
+                    body = msgpack.packb(content, use_bin_type=True)
+                else:
+                    body = json.dumps(content).encode('utf-8')
+                body = self.bodies[content_type] = body
+            return body
+
+    def encode(self):
+        """Encode the bodies of every format now and drop the data, e.g. to keep a large listing once"""
+        for content_type in self.formats:
+            self.body(content_type)
+        self.data = None
+        return self
+
+    def content_type(self, accept):
+        if MSGPACK in self.formats and MSGPACK in (accept or ''):
+            return MSGPACK
+        return JSON
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are written separately, Nagle would delay the body of a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.fake.count('connections')
+
+    def respond(self, method):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        fake.record(method, url.path, parse_qs(url.query), self.headers)
+        endpoint = fake.endpoints.get(url.path)
+        if endpoint is None:
+            return self.send_body(404, JSON, b'{"code": 1, "description": "not found"}')
+        status = endpoint.status()
+        if status != 200:
+            return self.send_body(status, JSON, b'{}')
+        content_type = endpoint.content_type(self.headers.get('Accept'))
+        body = endpoint.body(content_type)
+        encoding = None
+        if fake.gzip and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            out = io.BytesIO()
+            with gzip.GzipFile(fileobj=out, mode='wb') as f:
+                f.write(body)
+            body = out.getvalue()
+            encoding = 'gzip'
+        self.send_body(200, content_type, body, encoding)
+
+    def send_body(self, status, content_type, body, encoding=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        for i in range(0, len(body), WRITE_SIZE):
+            self.wfile.write(body[i:i + WRITE_SIZE])
+
+    def do_GET(self):
+        self.respond('GET')
+
+    def do_POST(self):
+        self.respond('POST')
+
+    def do_PUT(self):
+        self.respond('PUT')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeServer(object):
+    """ restfulframework stand-in listening on a free local port, served by a background thread
+        The requests are recorded as (method, path, query, headers) tuples.
+    """
+    def __init__(self, gzip=False):
+        self.endpoints = {}
+        self.requests = []
+        self.counters = {}
+        self.gzip = gzip
+        self.lock = threading.Lock()
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def add(self, path, data, **kwargs):
+        endpoint = self.endpoints['/' + path.lstrip('/')] = Endpoint(data, **kwargs)
+        return endpoint
+
+    def record(self, method, path, query, headers):
+        with self.lock:
+            self.requests.append((method, path, query, dict(headers.items())))
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class Instance(object):
+    """ClientManager of a command run without keystone, RestRequest reads the URL from OS_REST_URL"""
+    _auth_required = False
+
+
+def rest_request(url):
+    os.environ['OS_REST_URL'] = url
+    return resthandler.RestRequest(Instance())
+
+
+class ClientManager(object):
+    def __init__(self, url):
+        self.resthandler = rest_request(url)
+
+
+class App(object):
+    """The part of the hostcli application used by the helpers"""
+    def __init__(self, url, stdout=None, stderr=None):
+        self.client_manager = ClientManager(url)
+        self.stdout = stdout or io.StringIO()
+        self.stderr = stderr or io.StringIO()
+        self.cloud_managers = []
+
+
+class EntryList(helper.ListerHelper):
+    """List the synthetic entries"""
+    def __init__(self, app, app_args, cmd_name=None):
+        super(EntryList, self).__init__(app, app_args, cmd_name)
+        self.endpoint = 'entries'
+        self.no_positional = True
+        self.arguments = [helper.SORT, helper.UTC]
+        self.columns = ['id', 'name', 'severity', 'count', 'time']
+        self.fieldmap = {'id': {helper.DISPLAY: 'Id'},
+                         'name': {helper.DISPLAY: 'Name'},
+                         'severity': {helper.DISPLAY: 'Severity'},
+                         'count': {helper.DISPLAY: 'Count'},
+                         'time': {helper.DISPLAY: 'Time'},
+                         helper.SORT: {helper.HELP: 'Comma separated list of sort keys and directions'},
+                         helper.UTC: {helper.HELP: 'Show the time in UTC'}}
+
+
+class ServerTestCase(unittest.TestCase):
+    """Runs a FakeServer per test, with the settings of resthandler and the cache directory restored afterwards"""
+    def setUp(self):
+        self.cache_home = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ['XDG_CACHE_HOME'] = self.cache_home
+        self.settings = dict(resthandler._settings)
+        resthandler.configure(retry_policy=retry.RetryPolicy(base_delay=0.001, max_delay=0.001))
+        self.server = FakeServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        resthandler.configure(**self.settings)
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.cache_home)
+
+
+def run_list(app, args=(), command=EntryList):
+    """Run the listing command with the command line arguments, returns the header and the list of the rows"""
+    cmd = command(app, None)
+    parsed_args = cmd.get_parser('entry list').parse_args(list(args))
+    header, rows = cmd.take_action(parsed_args)
+    return header, list(rows)
@@ -0,0 +1,113 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" The thin client and the daemon, with the hostcli application replaced by an echo """
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from hostcli import client
+from hostcli import daemon
+
+
+class EchoDaemon(daemon.Daemon):
+    """Writes the command line, the standard input and an environment variable back"""
+    def run(self, argv, stdin, stdout, stderr):
+        stdout.write(u' '.join(argv) + u'\n')
+        stdout.write(stdin.read())
+        stderr.write(os.environ.get('HOSTCLI_TEST', u''))
+        return len(argv)
+
+
+class Stdin(object):
+    """Standard input of a caller that never closes it"""
+    def __init__(self, text=None):
+        self.text = text
+
+    def read(self):
+        if self.text is None:
+            raise AssertionError('the standard input was read')
+        return self.text
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ['XDG_CACHE_HOME'] = self.directory
+        os.environ['HOSTCLI_DAEMON_SOCKET'] = os.path.join(self.directory, 'daemon.sock')
+        os.environ.pop('HOSTCLI_NO_DAEMON', None)
+        self.server = EchoDaemon(os.environ['HOSTCLI_DAEMON_SOCKET'])
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.streams = sys.stdin, sys.stdout, sys.stderr
+        sys.stdout = io.StringIO()
+        sys.stderr = io.StringIO()
+
+    def tearDown(self):
+        sys.stdin, sys.stdout, sys.stderr = self.streams
+        self.server.shutdown()
+        self.server.server_close()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.directory)
+
+    def test_forward(self):
+        sys.stdin = Stdin()
+        os.environ['HOSTCLI_TEST'] = 'env'
+        self.assertEqual(3, client.main(['has', 'show', 'nodes']))
+        self.assertEqual('has show nodes\n', sys.stdout.getvalue())
+        self.assertEqual('env', sys.stderr.getvalue())
+
+    def test_batch_stdin(self):
+        sys.stdin = Stdin(u'has show nodes\n')
+        self.assertEqual(2, client.main(['--batch', '-']))
+        self.assertEqual('--batch -\nhas show nodes\n', sys.stdout.getvalue())
+
+    def test_reads_stdin(self):
+        self.assertTrue(client.reads_stdin(['--batch', '-']))
+        self.assertTrue(client.reads_stdin(['--debug', '--batch=-']))
+        self.assertFalse(client.reads_stdin(['--batch', 'commands.txt']))
+        self.assertFalse(client.reads_stdin(['--batch']))
+        self.assertFalse(client.reads_stdin(['has', 'show', 'nodes']))
+
+    def test_concurrent_commands(self):
+        # a command runs in a forked child, a connection does not wait for the previous one
+        sys.stdin = Stdin()
+        threads = [threading.Thread(target=client.main, args=(['list', str(i)],)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(sorted('list %d' % i for i in range(5)), sorted(sys.stdout.getvalue().splitlines()))
+
+    def test_token_cache_is_opt_in(self):
+        self.assertIsNone(self.server.token_cache)
+        path = os.path.join(self.directory, 'cached.sock')
+        server = daemon.Daemon(path, token_cache=True)
+        try:
+            self.assertIsNotNone(server.token_cache)
+        finally:
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
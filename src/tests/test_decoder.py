@@ -0,0 +1,89 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Incremental decoding of the data of the responses, whatever the chunks they arrive in """
+
+import json
+import unittest
+from collections import OrderedDict
+
+from hostcli import decoder
+
+import fakeserver
+
+DOCUMENT = OrderedDict([('code', 0),
+                        ('data', fakeserver.make_entries(50)),
+                        ('description', u'déjà vu'),
+                        ('numbers', [1, 2.5, -3e10, 12345678901234567890])])
+
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class JSONItemsTest(unittest.TestCase):
+    def check(self, body, size):
+        result = {}
+        items = list(decoder.iter_json_items(chunked(body, size), result))
+        self.assertEqual(list(DOCUMENT['data'].items()), items)
+        self.assertEqual(dict((k, v) for k, v in DOCUMENT.items() if k != 'data'), result)
+
+    def test_chunk_sizes(self):
+        body = json.dumps(DOCUMENT).encode('utf-8')
+        for size in (1, 2, 3, 7, 64, 1000, len(body)):
+            self.check(body, size)
+
+    def test_whitespace(self):
+        self.check(json.dumps(DOCUMENT, indent=4).encode('utf-8'), 5)
+
+    def test_items_arrive_before_the_end(self):
+        chunks = iter(chunked(json.dumps(DOCUMENT).encode('utf-8'), 100))
+        items = decoder.iter_json_items(chunks, {})
+        next(items)
+        self.assertIsNotNone(next(chunks, None))
+
+    def test_truncated(self):
+        body = json.dumps(DOCUMENT).encode('utf-8')
+        self.assertRaises(ValueError, list, decoder.iter_json_items(chunked(body[:-20], 10), {}))
+
+
+@unittest.skipIf(decoder.msgpack is None, 'msgpack is not installed')
+class MsgpackItemsTest(unittest.TestCase):
+    def test_chunk_sizes(self):
+        body = decoder.msgpack.packb(DOCUMENT, use_bin_type=True)
+        for size in (1, 3, 64, len(body)):
+            result = {}
+            items = list(decoder.iter_msgpack_items(chunked(body, size), result))
+            self.assertEqual(list(DOCUMENT['data'].items()), items)
+            self.assertEqual(DOCUMENT['description'], result['description'])
+
+
+class StreamedListTest(fakeserver.ServerTestCase):
+    def test_streamed_rows(self):
+        entries = fakeserver.make_entries(2000)
+        self.server.add('entries', entries)
+        header, rows = fakeserver.run_list(fakeserver.App(self.server.url), ['--utc'])
+        self.assertEqual(['Id', 'Name', 'Severity', 'Count', 'Time'], header)
+        self.assertEqual([[v['id'], v['name'], v['severity'], v['count'], v['time']] for v in entries.values()], rows)
+
+    def test_streamed_json(self):
+        entries = fakeserver.make_entries(2000)
+        self.server.add('entries', entries, formats=(fakeserver.JSON,))
+        header, rows = fakeserver.run_list(fakeserver.App(self.server.url), ['--utc'])
+        self.assertEqual(list(entries), [row[0] for row in rows])
+
+
+if __name__ == '__main__':
+    unittest.main()
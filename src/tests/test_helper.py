@@ -0,0 +1,173 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" The listing pipeline of the helpers: sorting, top-k selection and the TIME column conversion """
+
+import calendar
+import os
+import random
+import time
+import unittest
+
+from hostcli import helper
+
+import fakeserver
+
+ZONES = ('UTC', 'Europe/Helsinki', 'America/New_York', 'Asia/Kolkata', 'Australia/Lord_Howe')
+
+
+def reference_sort(data, plan):
+    """One stable sort per column, the last key first, as get_sorted_keys did before the sort plan"""
+    keys = list(data)
+    for field, descending in reversed(plan):
+        keys.sort(key=lambda k: helper._sort_value(data[k][field]), reverse=descending)
+    return keys
+
+
+class SortTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(4)
+        values = [None, 1, 2, 2.5, u'a', u'b', u'10']
+        self.data = dict(('k%04d' % i, {'a': rnd.choice(values[1:3]),
+                                        'b': rnd.choice(values),
+                                        'c': rnd.randint(0, 5),
+                                        'd': rnd.choice(values[4:])})
+                         for i in range(1000))
+
+    def test_plans(self):
+        for plan in ([('a', False)],
+                     [('c', True)],
+                     [('a', False), ('c', True)],
+                     [('b', True), ('a', False), ('c', False)],
+                     [('c', True), ('b', True)],
+                     [('d', True), ('a', True), ('b', False)]):
+            expected = reference_sort(self.data, plan)
+            keys = helper.HelperBase.sort_keys(list(self.data), self.data, plan)
+            self.assertEqual(expected, keys, plan)
+
+    def test_top_k(self):
+        for plan in ([('b', True), ('c', False)], [('a', True), ('c', True)], [('c', False)], [('d', False)]):
+            expected = reference_sort(self.data, plan)
+            for limit in (0, 1, 10, 999, 2000):
+                keys = helper.HelperBase.sort_keys(list(self.data), self.data, plan, limit)
+                self.assertEqual(expected[:limit], keys, plan)
+
+
+class TimeConverterTest(unittest.TestCase):
+    def setUp(self):
+        self.tz = os.environ.get('TZ')
+
+    def tearDown(self):
+        if self.tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+
+    def test_same_as_generic(self):
+        stamps = ['2019-03-31T00:59:59.999Z', '2019-03-31T01:00:00Z', '2019-10-27T00:30Z', '2019-10-27T01:30:00.5Z',
+                  '2019-11-03T05:59:59.123456Z', '2019-11-03T06:00:00.000Z', '2020-02-29Z',
+                  '2019-04-06T15:29:59.9999999Z', '1999-12-31T23:59:59']
+        for zone in ZONES:
+            os.environ['TZ'] = zone
+            time.tzset()
+            convert = helper.LocalTimeConverter()
+            for stamp in stamps:
+                self.assertEqual(helper.HelperBase.convert_utc_to_timezone_generic(stamp), convert(stamp),
+                                 '%s in %s' % (stamp, zone))
+
+    def test_every_hour_of_a_year(self):
+        os.environ['TZ'] = 'Europe/Helsinki'
+        time.tzset()
+        convert = helper.LocalTimeConverter()
+        start = calendar.timegm((2019, 1, 1, 0, 15, 0))
+        for hour in range(0, 366 * 24, 7):
+            stamp = time.strftime('%Y-%m-%dT%H:%M:%S.250Z', time.gmtime(start + hour * 3600))
+            self.assertEqual(helper.HelperBase.convert_utc_to_timezone_generic(stamp), convert(stamp))
+
+
+class SortedListTest(fakeserver.ServerTestCase):
+    def setUp(self):
+        super(SortedListTest, self).setUp()
+        self.entries = fakeserver.make_entries(3000)
+        self.server.add('entries', self.entries)
+        self.app = fakeserver.App(self.server.url)
+
+    def test_sorted(self):
+        header, rows = fakeserver.run_list(self.app, ['--sort', 'Severity,Count:desc', '--utc'])
+        expected = reference_sort(self.entries, [('severity', False), ('count', True)])
+        self.assertEqual(expected, [row[0] for row in rows])
+
+    def test_limit(self):
+        header, rows = fakeserver.run_list(self.app, ['--sort', 'Count:desc,Id', '--limit', '5'])
+        expected = reference_sort(self.entries, [('count', True), ('id', False)])[:5]
+        self.assertEqual(expected, [row[0] for row in rows])
+
+    def test_time_is_converted(self):
+        header, rows = fakeserver.run_list(self.app, ['--sort', 'Id'])
+        self.assertEqual([helper.HelperBase.convert_utc_to_timezone_generic(v['time']) for v in self.entries.values()],
+                         [row[4] for row in rows])
+
+
+class PagedEntryList(fakeserver.EntryList):
+    def __init__(self, app, app_args, cmd_name=None):
+        super(PagedEntryList, self).__init__(app, app_args, cmd_name)
+        self.pagination = {helper.LIMIT: 'limit', helper.MARKER: 'marker'}
+        self.page_size = 10
+
+
+class NumberedEntryList(PagedEntryList):
+    def __init__(self, app, app_args, cmd_name=None):
+        super(NumberedEntryList, self).__init__(app, app_args, cmd_name)
+        self.pagination = {helper.LIMIT: 'limit', helper.PAGE: 'page'}
+
+
+class EntryShow(helper.ShowOneHelper):
+    def __init__(self, app, app_args, cmd_name=None):
+        super(EntryShow, self).__init__(app, app_args, cmd_name)
+        self.endpoint = 'entries'
+        self.no_positional = True
+        self.arguments = [helper.SORT]
+        self.fieldmap = {helper.SORT: {helper.HELP: 'Sort keys'}}
+
+
+class PagedListTest(fakeserver.ServerTestCase):
+    """The fake server ignores the paging parameters, it always sends the same full page"""
+    def setUp(self):
+        super(PagedListTest, self).setUp()
+        self.entries = fakeserver.make_entries(10)
+        self.server.add('entries', self.entries)
+        self.app = fakeserver.App(self.server.url)
+
+    def test_marker_not_moving_forward(self):
+        for args in ([], ['--sort', 'Id']):
+            del self.server.requests[:]
+            header, rows = fakeserver.run_list(self.app, args, PagedEntryList)
+            self.assertEqual(list(self.entries), [row[0] for row in rows])
+            self.assertEqual([['10'], ['10']], [r[2].get('limit') for r in self.server.requests])
+            self.assertEqual(['entry-0000009'], self.server.requests[1][2]['marker'])
+
+    def test_page_not_moving_forward(self):
+        header, rows = fakeserver.run_list(self.app, [], NumberedEntryList)
+        self.assertEqual(list(self.entries), [row[0] for row in rows])
+        self.assertEqual([['1'], ['2']], [r[2].get('page') for r in self.server.requests])
+
+    def test_limit_only_on_lists(self):
+        self.assertIn('--limit', PagedEntryList(self.app, None).get_parser('entry list').format_usage())
+        self.assertNotIn('--limit', EntryShow(self.app, None).get_parser('entry show').format_usage())
+
+
+if __name__ == '__main__':
+    unittest.main()
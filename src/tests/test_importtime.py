@@ -0,0 +1,63 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Import time budget of the modules loaded by every hostcli invocation
+    hostcli.client and hostcli.main must not import osc_lib, cliff, keystoneauth1 or
+    requests, which take about a second. HOSTCLI_IMPORT_BUDGET_MS overrides the budget.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('hostcli.client', 'hostcli.main')
+HEAVY = ('osc_lib', 'cliff', 'keystoneauth1', 'requests', 'openstack')
+BUDGET_MS = float(os.environ.get('HOSTCLI_IMPORT_BUDGET_MS', 50))
+
+
+def import_times(modules):
+    """Returns the cumulative import time in microseconds of every module imported with the modules"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([SRC] + [p for p in [env.get('PYTHONPATH')] if p])
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import %s' % ', '.join(modules)],
+                               stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    _, stderr = process.communicate()
+    if process.returncode:
+        raise Exception(stderr)
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs python 3.7')
+class ImportTimeTest(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        heavy = [name for name in import_times(MODULES) if name.split('.')[0] in HEAVY]
+        self.assertEqual([], heavy)
+
+    def test_budget(self):
+        times = import_times(MODULES)
+        total_ms = sum(times[m] for m in MODULES) / 1000.0
+        self.assertLess(total_ms, BUDGET_MS, 'importing %s took %.1f ms' % (', '.join(MODULES), total_ms))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" RestRequest against the fake server: the pooled session and the wire format negotiation """
+
+import unittest
+
+from hostcli import decoder
+from hostcli import resthandler
+
+import fakeserver
+
+
+class SessionTest(fakeserver.ServerTestCase):
+    def setUp(self):
+        super(SessionTest, self).setUp()
+        self.server.add('status', {'state': 'up'})
+
+    def test_connection_is_reused(self):
+        req = fakeserver.rest_request(self.server.url)
+        for i in range(20):
+            self.assertEqual({'state': 'up'}, req.get('status')['data'])
+        self.assertEqual(1, self.server.counters['connections'])
+
+    def test_no_keepalive(self):
+        resthandler.configure(keepalive=False)
+        req = fakeserver.rest_request(self.server.url)
+        for i in range(5):
+            req.get('status')
+        self.assertEqual(5, self.server.counters['connections'])
+
+    def test_operations_keep_the_order(self):
+        for i in range(10):
+            self.server.add('item/%d' % i, {'index': i})
+        req = fakeserver.rest_request(self.server.url)
+        results = req.operations([('get', 'item/%d' % i) for i in range(10)])
+        self.assertEqual([({'code': 0, 'description': '', 'data': {'index': i}}, None) for i in range(10)], results)
+
+
+class WireFormatTest(fakeserver.ServerTestCase):
+    def accept(self):
+        return self.server.requests[-1][3].get('Accept')
+
+    @unittest.skipIf(decoder.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_is_negotiated(self):
+        self.server.add('entries', fakeserver.make_entries(10))
+        req = fakeserver.rest_request(self.server.url)
+        response = req._operation('get', 'entries', decode_json=False, decoded=True)
+        self.assertTrue(decoder.is_msgpack(response))
+        self.assertEqual(fakeserver.make_entries(10), decoder.decode(response)['data'])
+
+    def test_json_fallback(self):
+        self.server.add('entries', fakeserver.make_entries(10), formats=(fakeserver.JSON,))
+        req = fakeserver.rest_request(self.server.url)
+        self.assertEqual(fakeserver.make_entries(10), req.get('entries')['data'])
+
+    def test_raw_response_is_json(self):
+        self.server.add('entries', fakeserver.make_entries(10))
+        req = fakeserver.rest_request(self.server.url)
+        self.assertEqual(fakeserver.make_entries(10), req.get('entries', decode_json=False).json()['data'])
+        self.assertNotIn('msgpack', self.accept() or '')
+
+    def test_json_wire_format(self):
+        resthandler.configure(wire_format=resthandler.JSON)
+        self.server.add('entries', fakeserver.make_entries(10))
+        req = fakeserver.rest_request(self.server.url)
+        req.get('entries')
+        self.assertNotIn('msgpack', self.accept() or '')
+
+    def test_gzip(self):
+        self.server.gzip = True
+        self.server.add('entries', fakeserver.make_entries(100))
+        req = fakeserver.rest_request(self.server.url)
+        self.assertEqual(fakeserver.make_entries(100), req.get('entries')['data'])
+        self.assertIn('gzip', self.server.requests[-1][3].get('Accept-Encoding'))
+
+
+if __name__ == '__main__':
+    unittest.main()
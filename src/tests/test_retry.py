@@ -0,0 +1,128 @@
+# Copyright 2019 Nokia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Retries and circuit breakers, driven by fake server endpoints failing on a schedule """
+
+import os
+import time
+import unittest
+
+import requests
+
+from hostcli import resthandler
+from hostcli import retry
+
+import fakeserver
+
+
+class RetryTest(fakeserver.ServerTestCase):
+    def configure(self, **kwargs):
+        settings = dict(attempts=5, base_delay=0.001, max_delay=0.001, failure_threshold=3, reset_timeout=30)
+        settings.update(kwargs)
+        resthandler.configure(retry_policy=retry.RetryPolicy(**settings))
+
+    def paths(self):
+        return [r[1] for r in self.server.requests]
+
+    def test_get_is_retried(self):
+        self.configure()
+        self.server.add('status', {'state': 'up'}, failures=[503, 502])
+        req = fakeserver.rest_request(self.server.url)
+        self.assertEqual({'state': 'up'}, req.get('status')['data'])
+        self.assertEqual(3, len(self.paths()))
+
+    def test_post_is_not_retried(self):
+        self.configure()
+        self.server.add('status', {'state': 'up'}, failures=[503])
+        req = fakeserver.rest_request(self.server.url)
+        self.assertEqual(503, req.post('status', data={'a': 1}, decode_json=False).status_code)
+        self.assertEqual(1, len(self.paths()))
+
+    def test_attempts_run_out(self):
+        self.configure(attempts=2, failure_threshold=10)
+        self.server.add('status', {'state': 'up'}, failures=[503] * 3)
+        req = fakeserver.rest_request(self.server.url)
+        self.assertRaises(requests.exceptions.HTTPError, req.get, 'status')
+        self.assertEqual(2, len(self.paths()))
+
+    def test_circuit_opens(self):
+        self.configure(attempts=1, failure_threshold=2)
+        self.server.add('alarms', {}, failures=[503] * 10)
+        self.server.add('status', {'state': 'up'})
+        req = fakeserver.rest_request(self.server.url)
+        for i in range(2):
+            self.assertRaises(requests.exceptions.HTTPError, req.get, 'alarms')
+        self.assertRaises(retry.CircuitOpen, req.get, 'alarms')
+        self.assertEqual(2, len(self.paths()))
+        # the breakers are kept per resource, the other modules of the backend are still used
+        self.assertEqual({'state': 'up'}, req.get('status')['data'])
+
+    def test_circuit_is_shared(self):
+        self.configure(attempts=1, failure_threshold=2)
+        self.server.add('alarms', {}, failures=[503] * 2)
+        for i in range(2):
+            self.assertRaises(requests.exceptions.HTTPError, fakeserver.rest_request(self.server.url).get, 'alarms')
+        # a new RestRequest, like another process, reads the state of the circuit from the file
+        self.assertRaises(retry.CircuitOpen, fakeserver.rest_request(self.server.url).get, 'alarms')
+
+    def test_half_open_circuit_closes(self):
+        self.configure(attempts=1, failure_threshold=1, reset_timeout=0.1)
+        self.server.add('alarms', {'a': 1}, failures=[503])
+        req = fakeserver.rest_request(self.server.url)
+        self.assertRaises(requests.exceptions.HTTPError, req.get, 'alarms')
+        self.assertRaises(retry.CircuitOpen, req.get, 'alarms')
+        time.sleep(0.15)
+        self.assertEqual({'a': 1}, req.get('alarms')['data'])
+        self.assertEqual({'a': 1}, req.get('alarms')['data'])
+
+    def test_open_circuit_waits_within_the_deadline(self):
+        self.configure(attempts=3, failure_threshold=1, reset_timeout=0.2)
+        self.server.add('alarms', {'a': 1}, failures=[503])
+        req = fakeserver.rest_request(self.server.url)
+        start = time.time()
+        self.assertEqual({'a': 1}, req.get('alarms')['data'])
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        # the probe is past the deadline, the request fails at once
+        self.configure(attempts=3, failure_threshold=1, reset_timeout=30, deadline=1)
+        self.server.add('alarms', {'a': 1}, failures=[503])
+        start = time.time()
+        self.assertRaises(retry.CircuitOpen, fakeserver.rest_request(self.server.url).get, 'alarms')
+        self.assertLess(time.time() - start, 1)
+
+    def test_success_writes_no_state(self):
+        self.configure()
+        self.server.add('status', {'state': 'up'})
+        req = fakeserver.rest_request(self.server.url)
+        req.get('status')
+        self.assertEqual([], os.listdir(os.path.join(self.cache_home, 'hostcli', 'circuits')))
+
+
+class BackoffTest(unittest.TestCase):
+    def test_delay_is_bounded(self):
+        policy = retry.RetryPolicy(base_delay=0.5, max_delay=8)
+        for attempt in range(1, 20):
+            self.assertTrue(0 <= policy.delay(attempt) <= min(8, 0.5 * 2 ** (attempt - 1)))
+
+    def test_deadline(self):
+        calls = []
+        policy = retry.RetryPolicy(attempts=100, deadline=0.2, base_delay=0.05, max_delay=0.05)
+        start = time.time()
+        self.assertEqual('fail', policy.call(lambda: calls.append(1) or 'fail', retry_result=lambda r: True))
+        self.assertLess(time.time() - start, 0.5)
+        self.assertLess(len(calls), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()